@@ -0,0 +1,76 @@
+"""
+Compares regenerating a detailed guide from scratch with expanding the concise
+answer (generate_detailed_instructions(previous_response=...)).
+
+For each query the concise answer is generated once, then both detailed modes
+are run against it. Token counts are estimates from datawizzy.tokens.
+
+Usage:
+    python benchmarks/bench_expand_mode.py --config config.json --provider local
+"""
+import argparse
+import time
+
+from datawizzy.nlp_processor import NLPProcessor
+from datawizzy.tokens import estimate_message_tokens, estimate_tokens
+
+QUERIES = [
+    "How do I drop rows with missing values from a pandas DataFrame?",
+    "How can I plot a histogram of a column with matplotlib?",
+    "How do I group a DataFrame by one column and average another?",
+    "How do I merge two DataFrames on a shared key?",
+]
+
+
+class RecordingProcessor(NLPProcessor):
+    """Records prompt and completion sizes of every provider call."""
+
+    def _generate_response(self, messages, max_tokens=1000, **kwargs):
+        response = super()._generate_response(messages, max_tokens=max_tokens, **kwargs)
+        self.last_usage = (estimate_message_tokens(messages), estimate_tokens(response))
+        return response
+
+
+def timed(call):
+    start = time.perf_counter()
+    call()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark expansion mode against full detailed regeneration.")
+    parser.add_argument('--config', default='config.json')
+    parser.add_argument('--provider', default='openai')
+    args = parser.parse_args()
+
+    nlp = RecordingProcessor(config_path=args.config, model_provider=args.provider)
+    totals = {'full': [0, 0, 0.0], 'expand': [0, 0, 0.0]}
+
+    print(f"{'mode':<7} {'prompt tok':>10} {'output tok':>10} {'seconds':>8}  query")
+    for query in QUERIES:
+        concise = nlp.generate_concise_response(query)
+        history = [{"role": "user", "content": query}, {"role": "assistant", "content": concise}]
+
+        runs = {
+            'full': lambda: nlp.generate_detailed_instructions(query, history),
+            'expand': lambda: nlp.generate_detailed_instructions(query, history, previous_response=concise),
+        }
+        for mode, call in runs.items():
+            elapsed = timed(call)
+            prompt_tokens, output_tokens = nlp.last_usage
+            totals[mode][0] += prompt_tokens
+            totals[mode][1] += output_tokens
+            totals[mode][2] += elapsed
+            print(f"{mode:<7} {prompt_tokens:>10} {output_tokens:>10} {elapsed:>8.2f}  {query[:40]}")
+
+    print()
+    for mode, (prompt_tokens, output_tokens, elapsed) in totals.items():
+        print(f"{mode:<7} {prompt_tokens:>10} {output_tokens:>10} {elapsed:>8.2f}  total")
+    full_output, expand_output = totals['full'][1], totals['expand'][1]
+    if full_output:
+        print(f"\nExpansion used {100 * expand_output / full_output:.0f}% of the output tokens "
+              f"and {100 * totals['expand'][2] / totals['full'][2]:.0f}% of the wall time.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+import logging
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class GenerationCancelled(Exception):
+    def __init__(self, reason: str = "cancelled", tokens_generated: int = 0):
+        """
+        Raised when a generation is abandoned because its token was cancelled or
+        its deadline passed.
+
+        Parameters:
+            reason (str): Why the generation was stopped.
+            tokens_generated (int): Completion tokens produced before it stopped.
+        """
+        super().__init__(f"Generation {reason}.")
+        self.reason = reason
+        self.tokens_generated = tokens_generated
+
+
+class CancellationToken:
+    def __init__(self, timeout: Optional[float] = None):
+        """
+        Carries a cancellation signal and optional deadline through a generation call.
+
+        Parameters:
+            timeout (Optional[float]): Seconds from now after which the token counts
+                as cancelled. None means no deadline.
+        """
+        self.deadline = None if timeout is None else time.monotonic() + timeout
+        self.reason: Optional[str] = None
+        self._event = threading.Event()
+        self._callbacks: Dict[int, Callable[[], None]] = {}
+        self._next_callback = 0
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self) -> bool:
+        if self._event.is_set():
+            return True
+        if self.deadline is not None and time.monotonic() >= self.deadline:
+            self.cancel("deadline exceeded")
+            return True
+        return False
+
+    def cancel(self, reason: str = "cancelled"):
+        """
+        Cancels the token and runs any registered callbacks. Later calls are no-ops.
+        """
+        with self._lock:
+            if self._event.is_set():
+                return
+            self.reason = reason
+            self._event.set()
+            callbacks = list(self._callbacks.values())
+            self._callbacks.clear()
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                logger.warning(f"Cancellation callback failed: {e}")
+
+    def remaining(self) -> Optional[float]:
+        """
+        Seconds left until the deadline, or None if the token has no deadline.
+        """
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - time.monotonic())
+
+    def raise_if_cancelled(self, tokens_generated: int = 0):
+        if self.cancelled:
+            raise GenerationCancelled(self.reason, tokens_generated)
+
+    def add_callback(self, callback: Callable[[], None]) -> Optional[int]:
+        """
+        Registers `callback` to run when the token is cancelled. If it already is,
+        the callback runs immediately.
+
+        Returns:
+            Optional[int]: Handle for remove_callback, or None if it already ran.
+        """
+        with self._lock:
+            if not self._event.is_set():
+                handle = self._next_callback
+                self._next_callback += 1
+                self._callbacks[handle] = callback
+                return handle
+        callback()
+        return None
+
+    def remove_callback(self, handle: Optional[int]):
+        if handle is None:
+            return
+        with self._lock:
+            self._callbacks.pop(handle, None)
+
+
+class CancellationMetrics:
+    """
+    Process-wide counters for generations stopped by cancellation.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.cancelled = 0
+        self.tokens_saved = 0
+
+    def record(self, tokens_saved: int):
+        with self._lock:
+            self.cancelled += 1
+            self.tokens_saved += max(0, tokens_saved)
+
+    def snapshot(self) -> Dict[str, int]:
+        with self._lock:
+            return {'cancelled': self.cancelled, 'tokens_saved': self.tokens_saved}
+
+
+cancellation_metrics = CancellationMetrics()
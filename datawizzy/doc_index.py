@@ -0,0 +1,354 @@
+import argparse
+import heapq
+import importlib
+import inspect
+import json
+import logging
+import math
+import mmap
+import os
+import re
+import time
+from array import array
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .tokens import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_INDEX_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'datawizzy', 'doc_index')
+DEFAULT_MODULES = ('pandas', 'numpy', 'matplotlib.pyplot', 'seaborn')
+
+# BM25 parameters
+K1 = 1.5
+B = 0.75
+
+MAX_SIGNATURE_CHARS = 160
+MAX_SUMMARY_CHARS = 200
+# Only the opening words of a docstring are indexed; the rest is mostly parameter tables.
+MAX_INDEXED_WORDS = 120
+# Name tokens are repeated so a match on the API name outweighs one in its prose.
+NAME_BOOST = 3
+
+STOPWORDS = frozenset("""
+    a an and are as at be by can do does for from how i if in into is it its me my of on or so
+    that the their then this to use using want was what when which with without you your
+""".split())
+
+_WORD_RE = re.compile(r"[a-z_][a-z0-9_]*")
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Splits text into lowercase index terms. Identifiers such as `read_csv` produce
+    both the full identifier and its parts so that "read csv" still matches.
+    """
+    terms = []
+    for word in _WORD_RE.findall(text.lower()):
+        parts = [part for part in word.split('_') if part]
+        if len(parts) > 1:
+            terms.append(word.strip('_'))
+        terms.extend(parts)
+    return [term for term in terms if term not in STOPWORDS and len(term) > 1]
+
+
+def _summarize(doc: Optional[str]) -> Tuple[str, str]:
+    if not doc:
+        return "", ""
+    summary = " ".join(doc.strip().split("\n\n")[0].split())
+    indexed = " ".join(doc.split()[:MAX_INDEXED_WORDS])
+    return summary[:MAX_SUMMARY_CHARS], indexed
+
+
+def _signature(obj) -> str:
+    try:
+        signature = inspect.signature(obj)
+    except (TypeError, ValueError):
+        return "" if inspect.isclass(obj) else "(...)"
+    parameters = list(signature.parameters.values())
+    if parameters and parameters[0].name == 'self':
+        # Unbound methods; dropping the parameter also drops a '/' that only covered self
+        signature = signature.replace(parameters=parameters[1:])
+    signature = str(signature)
+    if len(signature) > MAX_SIGNATURE_CHARS:
+        signature = signature[:MAX_SIGNATURE_CHARS - 4] + "...)"
+    return signature
+
+
+def _iter_api(module_name: str) -> Iterable[Tuple[str, object]]:
+    module = importlib.import_module(module_name)
+    for name in dir(module):
+        if name.startswith('_'):
+            continue
+        try:
+            obj = getattr(module, name)
+        except Exception:
+            continue
+        if inspect.ismodule(obj) or not callable(obj):
+            continue
+        qualname = f"{module_name}.{name}"
+        yield qualname, obj
+        if inspect.isclass(obj):
+            for member_name in dir(obj):
+                if member_name.startswith('_'):
+                    continue
+                try:
+                    member = getattr(obj, member_name)
+                except Exception:
+                    continue
+                if callable(member) or isinstance(inspect.getattr_static(obj, member_name, None), property):
+                    yield f"{qualname}.{member_name}", member
+
+
+def _collect_documents(modules: Iterable[str]) -> List[Tuple[str, List[str]]]:
+    documents = []
+    seen = set()
+    for module_name in modules:
+        try:
+            entries = list(_iter_api(module_name))
+        except ImportError:
+            logger.warning(f"Skipping {module_name}: module is not installed.")
+            continue
+        for qualname, obj in entries:
+            if qualname in seen:
+                continue
+            seen.add(qualname)
+            summary, indexed = _summarize(inspect.getdoc(obj))
+            snippet = f"{qualname}{_signature(obj) if callable(obj) else ''}"
+            if summary:
+                snippet += f" - {summary}"
+            terms = tokenize(qualname.replace('.', ' ')) * NAME_BOOST + tokenize(indexed)
+            documents.append((snippet, terms))
+    return documents
+
+
+def build_index(output_dir: str = DEFAULT_INDEX_DIR, modules: Iterable[str] = DEFAULT_MODULES) -> int:
+    """
+    Builds a BM25 inverted index over the docstrings and signatures of the installed
+    libraries and writes it to `output_dir` as flat binary files that DocIndex maps
+    into memory, including the sorted vocabulary.
+
+    Parameters:
+        output_dir (str): Directory the index files are written to.
+        modules (Iterable[str]): Modules whose public API is indexed.
+
+    Returns:
+        int: The number of indexed API entries.
+    """
+    modules = list(modules)
+    documents = _collect_documents(modules)
+
+    postings: Dict[str, List[Tuple[int, int]]] = {}
+    doc_lengths = array('I')
+    doc_offsets = array('Q', [0])
+    doc_text = bytearray()
+    for doc_id, (snippet, terms) in enumerate(documents):
+        doc_lengths.append(len(terms))
+        doc_text.extend(snippet.encode('utf-8'))
+        doc_offsets.append(len(doc_text))
+        for term, tf in Counter(terms).items():
+            postings.setdefault(term, []).append((doc_id, min(tf, 0xFFFF)))
+
+    postings_docs = array('I')
+    postings_tfs = array('H')
+    # Sorted term text, with each term's byte offset and first posting; the extra
+    # trailing entry of each lets term i span [offsets[i], offsets[i + 1]).
+    term_text = bytearray()
+    term_offsets = array('Q', [0])
+    term_postings = array('Q', [0])
+    for term in sorted(postings):
+        entries = postings[term]
+        term_text.extend(term.encode('utf-8'))
+        term_offsets.append(len(term_text))
+        postings_docs.extend(doc_id for doc_id, _ in entries)
+        postings_tfs.extend(tf for _, tf in entries)
+        term_postings.append(len(postings_docs))
+
+    os.makedirs(output_dir, exist_ok=True)
+    for filename, data in (('docs.bin', doc_text), ('terms.bin', term_text)):
+        with open(os.path.join(output_dir, filename), 'wb') as f:
+            f.write(data)
+    for filename, values in (
+        ('doc_offsets.bin', doc_offsets),
+        ('doc_lengths.bin', doc_lengths),
+        ('postings_docs.bin', postings_docs),
+        ('postings_tfs.bin', postings_tfs),
+        ('term_offsets.bin', term_offsets),
+        ('term_postings.bin', term_postings),
+    ):
+        with open(os.path.join(output_dir, filename), 'wb') as f:
+            values.tofile(f)
+    meta = {
+        'modules': modules,
+        'num_docs': len(documents),
+        'avg_doc_length': (sum(doc_lengths) / len(documents)) if documents else 0.0,
+        'num_terms': len(postings),
+    }
+    with open(os.path.join(output_dir, 'meta.json'), 'w') as f:
+        json.dump(meta, f)
+
+    logger.info(f"Indexed {len(documents)} API entries from {', '.join(modules)} into {output_dir}.")
+    return len(documents)
+
+
+class DocIndex:
+    def __init__(self, index_dir: str = DEFAULT_INDEX_DIR):
+        """
+        Opens an index written by build_index. The vocabulary, postings and snippet
+        text stay on disk and are paged in by the OS as queries touch them; terms are
+        found by binary search over the sorted vocabulary.
+
+        Parameters:
+            index_dir (str): Directory containing the index files.
+
+        Raises:
+            FileNotFoundError: If no index, or only one from an older version, has
+                been built at `index_dir`.
+        """
+        meta_path = os.path.join(index_dir, 'meta.json')
+        if not os.path.exists(meta_path):
+            raise FileNotFoundError(f"No documentation index found at {index_dir}.")
+        with open(meta_path, 'r') as f:
+            meta = json.load(f)
+        if 'num_terms' not in meta:
+            raise FileNotFoundError(f"The documentation index at {index_dir} is out of date; rebuild it.")
+        self.index_dir = index_dir
+        self.modules = meta['modules']
+        self.num_docs = meta['num_docs']
+        self.avg_doc_length = meta['avg_doc_length'] or 1.0
+        self.num_terms = meta['num_terms']
+
+        self._maps = []
+        self._docs = self._map('docs.bin', 'B')
+        self._doc_offsets = self._map('doc_offsets.bin', 'Q')
+        self._doc_lengths = self._map('doc_lengths.bin', 'I')
+        self._postings_docs = self._map('postings_docs.bin', 'I')
+        self._postings_tfs = self._map('postings_tfs.bin', 'H')
+        self._terms = self._map('terms.bin', 'B')
+        self._term_offsets = self._map('term_offsets.bin', 'Q')
+        self._term_postings = self._map('term_postings.bin', 'Q')
+
+    def _map(self, filename: str, typecode: str):
+        with open(os.path.join(self.index_dir, filename), 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return memoryview(array(typecode))
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._maps.append(mapped)
+        return memoryview(mapped).cast(typecode)
+
+    def _term(self, i: int) -> bytes:
+        return bytes(self._terms[self._term_offsets[i]:self._term_offsets[i + 1]])
+
+    def _postings(self, term: str) -> Optional[Tuple[int, int]]:
+        """
+        Returns (start, count) of `term`'s postings, or None if it is not indexed.
+        """
+        key = term.encode('utf-8')
+        low, high = 0, self.num_terms
+        while low < high:
+            middle = (low + high) // 2
+            if self._term(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        if low == self.num_terms or self._term(low) != key:
+            return None
+        start = self._term_postings[low]
+        return start, self._term_postings[low + 1] - start
+
+    def snippet(self, doc_id: int) -> str:
+        start, end = self._doc_offsets[doc_id], self._doc_offsets[doc_id + 1]
+        return bytes(self._docs[start:end]).decode('utf-8')
+
+    def search(self, query: str, k: int = 3) -> List[str]:
+        """
+        Returns the snippets of the `k` API entries that best match `query` under BM25.
+        """
+        scores: Dict[int, float] = {}
+        for term in set(tokenize(query)):
+            entry = self._postings(term)
+            if entry is None:
+                continue
+            start, count = entry
+            idf = math.log(1 + (self.num_docs - count + 0.5) / (count + 0.5))
+            for i in range(start, start + count):
+                doc_id = self._postings_docs[i]
+                tf = self._postings_tfs[i]
+                norm = K1 * (1 - B + B * self._doc_lengths[doc_id] / self.avg_doc_length)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (K1 + 1) / (tf + norm)
+        top = heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+        return [self.snippet(doc_id) for doc_id, _ in top]
+
+    def close(self):
+        self._docs = self._doc_offsets = self._doc_lengths = None
+        self._postings_docs = self._postings_tfs = None
+        self._terms = self._term_offsets = self._term_postings = None
+        for mapped in self._maps:
+            try:
+                mapped.close()
+            except BufferError:
+                # A snippet view is still alive somewhere; the map is released with it.
+                pass
+        self._maps = []
+
+
+def format_reference_context(snippets: List[str], token_budget: int) -> str:
+    """
+    Formats retrieved snippets for injection into a prompt, skipping any snippet
+    that would take the block over `token_budget` tokens.
+
+    Returns:
+        str: The reference block, or an empty string if nothing fits.
+    """
+    header = "Relevant API reference (use these signatures):"
+    used = estimate_tokens(header)
+    lines = []
+    for snippet in snippets:
+        line = f"- {snippet}"
+        cost = estimate_tokens(line)
+        if used + cost > token_budget:
+            continue
+        lines.append(line)
+        used += cost
+    if not lines:
+        return ""
+    return "\n".join([header] + lines)
+
+
+def load_doc_index(index_dir: str = DEFAULT_INDEX_DIR) -> Optional[DocIndex]:
+    """
+    Opens the documentation index if one has been built, otherwise returns None.
+    """
+    try:
+        return DocIndex(index_dir)
+    except FileNotFoundError:
+        logger.info(f"No documentation index at {index_dir}; prompts will not be grounded.")
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Build the offline documentation index used to ground DataWizzy prompts.'
+    )
+    parser.add_argument('-o', '--output', default=DEFAULT_INDEX_DIR, help='Directory to write the index to')
+    parser.add_argument('-m', '--modules', nargs='+', default=list(DEFAULT_MODULES), help='Modules to index')
+    parser.add_argument('-q', '--query', help='Run a test query against the index after building it')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    count = build_index(args.output, args.modules)
+    print(f"Indexed {count} API entries into {args.output}")
+
+    if args.query:
+        index = DocIndex(args.output)
+        start = time.perf_counter()
+        results = index.search(args.query)
+        elapsed = (time.perf_counter() - start) * 1000
+        for snippet in results:
+            print(f"- {snippet}")
+        print(f"({elapsed:.2f} ms)")
+
+
+if __name__ == '__main__':
+    main()
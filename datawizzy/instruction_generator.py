@@ -1,13 +1,121 @@
+import re
+
+# A line opening a numbered step, e.g. "1. Load the data", "**2)** Plot" or "Step 3: Clean"
+STEP_PATTERN = re.compile(r"^\s*(?:#+\s*)?(?:\*\*)?(?:step\s+)?(\d+)\s*[.):]", re.IGNORECASE)
+# A heading in an expansion response, e.g. "### Step 2", "### Step 2: Plot the data",
+# "**Step 2**" or "### Additional steps"
+EXPANSION_HEADING_PATTERN = re.compile(
+    r"^\s*(?:#{2,4}\s*(?:step\s+(\d+)\b.*|(additional.*))"
+    r"|\*\*\s*step\s+(\d+)\b[^*]*\*\*\s*:?)\s*$",
+    re.IGNORECASE
+)
+
 class InstructionGenerator:
     def format_instructions(self, raw_text):
         # Split the raw text into steps and format code blocks
         lines = raw_text.split('\n')
         formatted_lines = []
+        in_code_block = False
         for line in lines:
             if line.strip().startswith('```') or line.strip().endswith('```'):
                 formatted_lines.append(line)
+                if line.count('```') % 2 == 1:
+                    in_code_block = not in_code_block
+            elif in_code_block:
+                # Already inside a fenced block; leave the code alone
+                formatted_lines.append(line)
             elif line.strip().startswith('import') or '=' in line:
                 formatted_lines.append(f'```python\n{line}\n```')
             else:
                 formatted_lines.append(line)
         return '\n'.join(formatted_lines)
+
+    def extract_code_blocks(self, text):
+        # Return the contents of fenced Python (or untagged) code blocks, in order
+        blocks = []
+        block_lines = None
+        is_python = False
+        for line in text.split('\n'):
+            if not line.strip().startswith('```'):
+                if block_lines is not None:
+                    block_lines.append(line)
+            elif block_lines is None:
+                is_python = line.strip()[3:].strip().lower() in ('', 'python', 'py')
+                block_lines = []
+            else:
+                code = '\n'.join(block_lines).strip('\n')
+                if is_python and code.strip():
+                    blocks.append(code)
+                block_lines = None
+        return blocks
+
+    def split_steps(self, text):
+        """
+        Splits a response into its introduction and its steps.
+
+        Steps start at numbered lines outside code blocks. A response with no
+        numbered steps is split into paragraphs instead.
+
+        Returns:
+            tuple: (intro, steps) where intro is a str and steps is a list of str.
+        """
+        intro_lines = []
+        steps = []
+        paragraphs = [[]]
+        in_code_block = False
+        for line in text.strip().split('\n'):
+            if not in_code_block and STEP_PATTERN.match(line):
+                steps.append([])
+            if not in_code_block and not line.strip():
+                paragraphs.append([])
+            (steps[-1] if steps else intro_lines).append(line)
+            paragraphs[-1].append(line)
+            if line.count('```') % 2 == 1:
+                in_code_block = not in_code_block
+
+        if not steps:
+            paragraphs = ['\n'.join(paragraph).strip() for paragraph in paragraphs]
+            return "", [paragraph for paragraph in paragraphs if paragraph]
+        return '\n'.join(intro_lines).strip(), ['\n'.join(step).strip() for step in steps]
+
+    def parse_expansion(self, expansion_text):
+        """
+        Parses an expansion response into per-step additions.
+
+        Returns:
+            tuple: (deltas, extra) where deltas maps 1-based step numbers to the text
+            to add under that step, and extra is text that belongs after the last step.
+        """
+        deltas = {}
+        extra_lines = []
+        current = None
+        in_code_block = False
+        for line in expansion_text.strip().split('\n'):
+            match = None if in_code_block else EXPANSION_HEADING_PATTERN.match(line)
+            if line.count('```') % 2 == 1:
+                in_code_block = not in_code_block
+            if match:
+                number = match.group(1) or match.group(3)
+                current = int(number) if number else None
+                if current is not None:
+                    deltas.setdefault(current, [])
+                continue
+            (deltas[current] if current is not None else extra_lines).append(line)
+        deltas = {number: '\n'.join(lines).strip() for number, lines in deltas.items()}
+        return {number: delta for number, delta in deltas.items() if delta}, '\n'.join(extra_lines).strip()
+
+    def merge_expansion(self, intro, steps, expansion_text):
+        """
+        Merges an expansion response into the original steps to form the full guide.
+        Additions for steps that don't exist are kept at the end.
+        """
+        deltas, extra = self.parse_expansion(expansion_text)
+        sections = [intro] if intro else []
+        for number, step in enumerate(steps, start=1):
+            delta = deltas.pop(number, None)
+            sections.append(f"{step}\n\n{delta}" if delta else step)
+        leftovers = [deltas[number] for number in sorted(deltas)]
+        if extra:
+            leftovers.append(extra)
+        sections.extend(leftovers)
+        return '\n\n'.join(sections)
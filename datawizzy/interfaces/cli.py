@@ -3,6 +3,7 @@ import sys
 from datawizzy.nlp_processor import NLPProcessor
 from datawizzy.instruction_generator import InstructionGenerator
 from datawizzy.safety import SafetyChecker
+from datawizzy.cancellation import CancellationToken, cancellation_metrics
 import textwrap
 import logging
 
@@ -53,6 +54,20 @@ def initialize_components(verbose=False):
         print(f"Initialization Error: {e}")
         sys.exit(1)
 
+def generate_interruptibly(generate, *args, **kwargs):
+    """
+    Calls a generation method with a cancellation token so that Ctrl-C also stops
+    work running outside the main thread (e.g. a local model batch).
+    """
+    token = CancellationToken()
+    try:
+        return generate(*args, cancel_token=token, **kwargs)
+    except KeyboardInterrupt:
+        token.cancel("interrupted")
+        logging.info(f"Generation interrupted; cancellation stats: {cancellation_metrics.snapshot()}")
+        print("\nCancelled.")
+        sys.exit(130)
+
 def display_response(title, content, verbose=False):
     print(f"\n**{title}:**\n")
     print(content)
@@ -68,13 +83,11 @@ def main():
 
     nlp, safety, generator = initialize_components(verbose=args.verbose)
 
-    conversation_history = f"User: {args.query}"
-
     # Generate initial instructions
     if args.verbose:
         print("[DEBUG] Generating initial instructions...")
     try:
-        raw_instructions = nlp.generate_instructions(args.query, conversation_history)
+        raw_instructions = generate_interruptibly(nlp.generate_concise_response, args.query)
     except Exception as e:
         print(f"Error generating instructions: {e}")
         sys.exit(1)
@@ -94,7 +107,9 @@ def main():
             if args.verbose:
                 print("[DEBUG] Generating detailed instructions...")
             try:
-                detailed_instructions = nlp.generate_detailed_instructions(args.query, conversation_history)
+                detailed_instructions = generate_interruptibly(
+                    nlp.generate_detailed_instructions, args.query, previous_response=raw_instructions
+                )
             except Exception as e:
                 print(f"Error generating detailed instructions: {e}")
                 break
@@ -2,19 +2,189 @@ import streamlit as st
 from datawizzy.nlp_processor import NLPProcessor
 from datawizzy.instruction_generator import InstructionGenerator
 from datawizzy.safety import SafetyChecker
+from datawizzy.verifier import SnippetVerifier
+from datawizzy.cancellation import CancellationToken
+from datawizzy.session_manager import SessionManager
+from datawizzy.setup import load_config
+from concurrent.futures import ThreadPoolExecutor
 import json
+import logging
 import os
+import time
+import uuid
+
+# Seconds before an unanswered generation is abandoned
+GENERATION_TIMEOUT = 120
+# User-facing text for each kind of generation
+GENERATION_MESSAGES = {
+    'concise': {
+        'spinner': 'DataWizzy is typing...',
+        'error': "Error generating instructions",
+        'refusal': "I'm sorry, but I can't assist with that request.",
+    },
+    'detailed': {
+        'spinner': 'Generating more detailed information...',
+        'error': "Error generating detailed instructions",
+        'refusal': "I'm sorry, but I can't provide more details on that request.",
+    },
+}
+
+@st.cache_resource
+def load_components(model_provider: str):
+    # Shared by every session in the server process rather than built per session
+    nlp = NLPProcessor(model_provider=model_provider)
+    safety = SafetyChecker()
+    generator = InstructionGenerator()
+    return nlp, safety, generator
 
 def initialize_components(model_provider: str):
     try:
-        nlp = NLPProcessor(model_provider=model_provider)
-        safety = SafetyChecker()
-        generator = InstructionGenerator()
-        return nlp, safety, generator
+        return load_components(model_provider)
     except Exception as e:
         st.error(f"Initialization Error: {e}")
         st.stop()
 
+@st.cache_resource
+def get_session_manager():
+    # Holds every session's conversation with a per-session memory cap and idle eviction
+    return SessionManager()
+
+def current_session():
+    return get_session_manager().get(st.session_state.user_id)
+
+def chat_history(messages):
+    """
+    Returns messages as sent to the model: assistant turns use the model's raw answer
+    rather than the formatted text and verification note shown in the chat.
+    """
+    history = []
+    for message in messages:
+        if message['role'] == 'user' and history and history[-1]['role'] == 'user':
+            # The earlier question was never answered (superseded or failed), so drop it
+            history.pop()
+        history.append({'role': message['role'], 'content': message.get('raw', message['content'])})
+    return history
+
+@st.cache_resource
+def get_verifier():
+    """
+    Returns the server's sandbox worker pool, shared by every session, or None if
+    the operator has not enabled VERIFY_CODE in config.json. Visitors cannot turn
+    verification on, since it runs model-written code on this machine.
+    """
+    try:
+        config = load_config('config.json')
+    except Exception:
+        return None
+    if not config.get('VERIFY_CODE', False):
+        return None
+    try:
+        return SnippetVerifier(sandbox_user=config.get('VERIFY_SANDBOX_USER', 'nobody'))
+    except Exception as e:
+        # Cached as None so a broken sandbox is not retried on every answer
+        logging.getLogger(__name__).error(f"Code verification disabled: {e}")
+        return None
+
+@st.cache_resource
+def get_generation_executor():
+    return ThreadPoolExecutor(max_workers=8, thread_name_prefix='datawizzy-generation')
+
+def run_cancellable(kind, generate, *args, message_index=None, **kwargs):
+    """
+    Runs a generation call off the script thread and waits for it. Starting one
+    cancels the session's previous generation, since a newer message or Need More
+    Info request replaces it. Any other widget interaction only interrupts this
+    script run; the generation keeps going and resume_generation picks it up.
+    """
+    cancel_generation("superseded")
+    token = CancellationToken(timeout=GENERATION_TIMEOUT)
+    future = get_generation_executor().submit(generate, *args, cancel_token=token, **kwargs)
+    st.session_state.pending_generation = {
+        'kind': kind, 'message_index': message_index, 'future': future, 'token': token
+    }
+    return wait_for_generation()
+
+def cancel_generation(reason):
+    pending = st.session_state.get('pending_generation')
+    if pending is not None:
+        pending['token'].cancel(reason)
+        st.session_state.pending_generation = None
+
+def wait_for_generation():
+    pending = st.session_state.pending_generation
+    heartbeat = st.empty()
+    while not pending['future'].done():
+        # Touching an element lets Streamlit stop this run if a newer one was requested
+        heartbeat.empty()
+        time.sleep(0.1)
+    st.session_state.pending_generation = None
+    return pending['future'].result()
+
+def resume_generation():
+    """
+    Finishes a generation whose script run was interrupted by an unrelated widget.
+    """
+    pending = st.session_state.get('pending_generation')
+    if pending is None:
+        return
+    with st.spinner(GENERATION_MESSAGES[pending['kind']]['spinner']):
+        try:
+            raw_response = wait_for_generation()
+        except Exception as e:
+            st.error(f"{GENERATION_MESSAGES[pending['kind']]['error']}: {e}")
+            return
+    complete_generation(pending['kind'], raw_response, pending['message_index'])
+
+def complete_generation(kind, raw_response, message_index=None):
+    """
+    Safety-checks and formats a finished answer, adds it to the conversation and
+    reruns the app to display it.
+    """
+    session = current_session()
+    try:
+        if st.session_state.safety.check_content(raw_response):
+            instructions = st.session_state.generator.format_instructions(raw_response)
+            # Keep the raw answer alongside the displayed one for expansion and history
+            ai_message = {
+                'role': 'assistant',
+                'content': add_verification_note(instructions, raw_response),
+                'raw': raw_response
+            }
+        else:
+            ai_message = {'role': 'assistant', 'content': GENERATION_MESSAGES[kind]['refusal']}
+    except Exception as e:
+        st.error(f"Error during safety check: {e}")
+        return
+
+    # Add the AI's response to the conversation history
+    session.append(ai_message)
+    if kind == 'detailed':
+        # Mark that a detailed response has been requested for this message
+        session.detailed_requested[message_index] = True
+
+    # Rerun the app to display the updated conversation
+    st.rerun()
+
+def add_verification_note(instructions, raw_response):
+    """
+    Runs the fenced code in the model's raw response through the sandbox and appends
+    the outcome to the formatted instructions.
+    """
+    verifier = get_verifier()
+    if verifier is None:
+        return instructions
+    try:
+        result = verifier.verify_instructions(raw_response)
+    except Exception as e:
+        logging.getLogger(__name__).error(f"Code verification failed to run: {e}")
+        st.warning("Code verification unavailable.")
+        return instructions
+    if result is None:
+        return instructions
+    if result.ok:
+        return f"{instructions}\n\n✅ *Code verified: ran without errors.*"
+    return f"{instructions}\n\n⚠️ *Code verification failed: {result.error}*"
+
 def add_chat_css():
     st.markdown(
         """
@@ -58,7 +228,8 @@ def add_chat_css():
 def display_conversation():
     chat_container = st.container()
     with chat_container:
-        for i, message in enumerate(st.session_state.messages):
+        session = current_session()
+        for i, message in enumerate(session.messages, start=session.offloaded_count):
             if message['role'] == 'user':
                 st.markdown(
                     f"<div class='chat-container'><div class='user-message'><strong>You:</strong> {message['content']}</div></div>",
@@ -70,7 +241,7 @@ def display_conversation():
                     unsafe_allow_html=True
                 )
                 # Check if a detailed response has already been requested for this message
-                if not st.session_state.detailed_requested.get(i, False):
+                if not session.detailed_requested.get(i, False):
                     if st.button('Need More Info', key=f'need_more_info_{i}'):
                         handle_need_more_info(i)
 
@@ -80,7 +251,7 @@ def save_conversation():
     """
     try:
         with open('conversation_history.json', 'w') as f:
-            json.dump(st.session_state.messages, f, indent=4)
+            json.dump(current_session().all_messages(), f, indent=4)
         st.success("Conversation history saved successfully!")
     except Exception as e:
         st.error(f"Error saving conversation history: {e}")
@@ -92,7 +263,9 @@ def load_conversation():
     if os.path.exists('conversation_history.json'):
         try:
             with open('conversation_history.json', 'r') as f:
-                st.session_state.messages = json.load(f)
+                current_session().replace_messages(json.load(f))
+            # A reply still being generated belongs to the conversation just replaced
+            cancel_generation("conversation replaced")
             st.success("Conversation history loaded successfully!")
         except Exception as e:
             st.error(f"Error loading conversation history: {e}")
@@ -100,46 +273,39 @@ def load_conversation():
         st.warning("No saved conversation history found.")
 
 def handle_need_more_info(message_index):
+    session = current_session()
+    # Convert the absolute message index into a position in the in-memory window
+    messages = list(session.messages)
+    position = message_index - session.offloaded_count
     corresponding_user_query = ""
-    for j in range(message_index-1, -1, -1):
-        if st.session_state.messages[j]['role'] == 'user':
-            corresponding_user_query = st.session_state.messages[j]['content']
+    for j in range(position-1, -1, -1):
+        if messages[j]['role'] == 'user':
+            corresponding_user_query = messages[j]['content']
             break
     if not corresponding_user_query:
         st.error("Original user query not found.")
         return
     
     # Generate the detailed AI response
-    with st.spinner('Generating more detailed information...'):
+    with st.spinner(GENERATION_MESSAGES['detailed']['spinner']):
         try:
             # Pass the entire conversation history as a list of dictionaries
-            detailed_instructions = st.session_state.nlp.generate_detailed_instructions(
+            detailed_instructions = run_cancellable(
+                'detailed',
+                st.session_state.nlp.generate_detailed_instructions,
                 corresponding_user_query,
-                st.session_state.messages  # Correctly pass as list of dicts
+                chat_history(messages),  # Recent turns within the session's memory cap
+                user=st.session_state.user_id,
+                # Expand the answer already shown instead of regenerating it; its steps are
+                # split from the raw answer, since formatting fences any line with '='
+                previous_response=messages[position].get('raw', messages[position]['content']),
+                message_index=message_index
             )
         except Exception as e:
-            st.error(f"Error generating detailed instructions: {e}")
+            st.error(f"{GENERATION_MESSAGES['detailed']['error']}: {e}")
             return
     
-    # Safety check
-    try:
-        if st.session_state.safety.check_content(detailed_instructions):
-            instructions = st.session_state.generator.format_instructions(detailed_instructions)
-            ai_message = instructions
-        else:
-            ai_message = "I'm sorry, but I can't provide more details on that request."
-    except Exception as e:
-        st.error(f"Error during safety check: {e}")
-        return
-    
-    # Append the detailed AI response to the conversation history
-    st.session_state.messages.append({'role': 'assistant', 'content': ai_message})
-    
-    # Mark that a detailed response has been requested for this message
-    st.session_state.detailed_requested[message_index] = True
-    
-    # Rerun the app to display the new message
-    st.rerun()
+    complete_generation('detailed', detailed_instructions, message_index)
 
 def main():
     # Set the page configuration
@@ -171,7 +337,7 @@ def main():
         # Sidebar model selection
         model_provider = st.selectbox(
             "Select LLM Provider",
-            ("openai", "ollama")
+            ("openai", "ollama", "local")
         )
 
         # Add Save and Load buttons
@@ -182,15 +348,16 @@ def main():
             load_conversation()
     
     # Initialize session state variables
-    if 'messages' not in st.session_state:
-        st.session_state.messages = []
-    if 'detailed_requested' not in st.session_state:
-        st.session_state.detailed_requested = {}
-    if 'nlp' not in st.session_state or 'safety' not in st.session_state or 'generator' not in st.session_state:
-        nlp, safety, generator = initialize_components(model_provider)
-        st.session_state.nlp = nlp
-        st.session_state.safety = safety
-        st.session_state.generator = generator
+    if 'user_id' not in st.session_state:
+        # Identifies this session to the session manager and the rate limiter
+        st.session_state.user_id = str(uuid.uuid4())
+    nlp, safety, generator = initialize_components(model_provider)
+    st.session_state.nlp = nlp
+    st.session_state.safety = safety
+    st.session_state.generator = generator
+    
+    with st.sidebar:
+        st.caption(f"Session memory: {current_session().memory_bytes / 1024:.1f} KB")
     
     # Add custom CSS
     add_chat_css()
@@ -205,39 +372,31 @@ def main():
     
     if submit_button and user_input:
         # Add the user's message to the conversation history
-        st.session_state.messages.append({'role': 'user', 'content': user_input})
+        session = current_session()
+        session.append({'role': 'user', 'content': user_input})
     
         # Generate the AI's response
-        with st.spinner('DataWizzy is typing...'):
+        with st.spinner(GENERATION_MESSAGES['concise']['spinner']):
             try:
                 # Pass the entire conversation history as a list of dictionaries
-                raw_instructions = st.session_state.nlp.generate_concise_response(
+                raw_instructions = run_cancellable(
+                    'concise',
+                    st.session_state.nlp.generate_concise_response,
                     user_input,
-                    st.session_state.messages  # Correctly pass as list of dicts
+                    chat_history(session.messages),  # Recent turns within the session's memory cap
+                    user=st.session_state.user_id
                 )
             except ValueError as ve:
                 st.error(f"Input validation error: {ve}")
                 return
             except Exception as e:
-                st.error(f"Error generating instructions: {e}")
+                st.error(f"{GENERATION_MESSAGES['concise']['error']}: {e}")
                 return
     
-        # Safety check
-        try:
-            if st.session_state.safety.check_content(raw_instructions):
-                instructions = st.session_state.generator.format_instructions(raw_instructions)
-                ai_message = instructions
-            else:
-                ai_message = "I'm sorry, but I can't assist with that request."
-        except Exception as e:
-            st.error(f"Error during safety check: {e}")
-            return
-    
-        # Add the AI's response to the conversation history
-        st.session_state.messages.append({'role': 'assistant', 'content': ai_message})
-    
-        # Rerun the app to display the updated conversation
-        st.rerun()
+        complete_generation('concise', raw_instructions)
+    else:
+        # A reply still being generated when another widget interrupted the last run
+        resume_generation()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,477 @@
+import logging
+import queue
+import threading
+import time
+from typing import Dict, Iterator, List, Optional
+
+from .cancellation import GenerationCancelled
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LOCAL_MODEL = "Qwen/Qwen2.5-0.5B-Instruct"
+
+# Sentinel pushed onto a generation's stream queue once it has finished.
+_STREAM_END = object()
+
+
+class LocalGeneration:
+    """
+    Handle for a single request submitted to a LocalInferenceBackend.
+
+    Text is pushed onto the handle by the scheduler thread as it is decoded, so
+    callers can either iterate over stream() or block on result().
+    """
+
+    def __init__(self, messages: List[Dict[str, str]], max_tokens: int, temperature: float):
+        self.messages = messages
+        self.max_tokens = max_tokens
+        self.temperature = temperature
+        self.prompt: Optional[str] = None
+        self.num_tokens = 0
+        self.error: Optional[BaseException] = None
+        self.submitted_at = time.monotonic()
+        self.first_token_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self._chunks: List[str] = []
+        self._stream = queue.Queue()
+        self._done = threading.Event()
+        self._cancelled = threading.Event()
+        self._finish_lock = threading.Lock()
+
+    @property
+    def done(self) -> bool:
+        return self._done.is_set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def cancel(self, reason: str = "cancelled"):
+        """
+        Asks the scheduler to stop decoding this request. Waiting callers get a
+        GenerationCancelled error; the rest of its batch carries on.
+        """
+        if self._done.is_set():
+            return
+        self._cancelled.set()
+        self._finish(GenerationCancelled(reason, self.num_tokens))
+
+    def _emit(self, text: str):
+        if self._done.is_set():
+            return
+        if self.first_token_at is None:
+            self.first_token_at = time.monotonic()
+        self.num_tokens += 1
+        if text:
+            self._chunks.append(text)
+            self._stream.put(text)
+
+    def _finish(self, error: Optional[BaseException] = None):
+        with self._finish_lock:
+            if self._done.is_set():
+                return
+            self.error = error
+            self.finished_at = time.monotonic()
+            self._done.set()
+        self._stream.put(_STREAM_END)
+
+    def stream(self) -> Iterator[str]:
+        """
+        Yields decoded text pieces as they are produced by the scheduler.
+
+        Raises:
+            Exception: Re-raises any error hit while generating this request.
+        """
+        while True:
+            item = self._stream.get()
+            if item is _STREAM_END:
+                break
+            yield item
+        if self.error is not None:
+            raise self.error
+
+    def result(self, timeout: Optional[float] = None) -> str:
+        """
+        Blocks until the generation has finished and returns the full text.
+
+        Raises:
+            TimeoutError: If the generation does not finish within `timeout` seconds.
+            Exception: Re-raises any error hit while generating this request.
+        """
+        if not self._done.wait(timeout):
+            raise TimeoutError("Local generation did not finish in time.")
+        if self.error is not None:
+            raise self.error
+        return "".join(self._chunks).strip()
+
+
+class LocalInferenceBackend:
+    def __init__(
+        self,
+        model_name: str = DEFAULT_LOCAL_MODEL,
+        max_batch_size: int = 8,
+        max_wait_ms: float = 10.0,
+        local_files_only: bool = True
+    ):
+        """
+        Runs a small causal language model in-process on CPU and serves concurrent
+        requests from a single scheduler thread.
+
+        Requests that arrive within `max_wait_ms` of each other (up to
+        `max_batch_size`) are decoded together, one shared forward pass per token.
+        Batching is continuous: finished requests leave the batch and queued ones
+        join it between decoding steps, so nobody waits for a whole batch to drain.
+
+        Parameters:
+            model_name (str): Hugging Face model id or path to a local model directory.
+            max_batch_size (int): Maximum number of requests decoded in one batch.
+            max_wait_ms (float): How long the scheduler waits to fill a batch once
+                the first request has arrived.
+            local_files_only (bool): Never reach out to the Hugging Face Hub; the
+                model must already be in the local cache or at `model_name`.
+        """
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be at least 1.")
+        if max_wait_ms < 0:
+            raise ValueError("max_wait_ms must be non-negative.")
+
+        self.model_name = model_name
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.local_files_only = local_files_only
+        self.batch_sizes: List[int] = []
+        # Requests that joined a batch already being decoded
+        self.joined_requests = 0
+
+        self._queue = queue.Queue()
+        self._stopping = False
+        self._load_model()
+
+        self._worker = threading.Thread(target=self._scheduler_loop, name="datawizzy-local-llm", daemon=True)
+        self._worker.start()
+        logger.info(f"Local inference backend started for model {model_name}.")
+
+    def _load_model(self):
+        # Imported here so other providers don't pay for loading torch at startup
+        try:
+            import torch
+            from transformers import AutoModelForCausalLM, AutoTokenizer
+        except ImportError:
+            raise ImportError(
+                "The transformers and torch packages are required to use the local model provider. "
+                "Install them with `poetry install --extras local`."
+            )
+        self._torch = torch
+        self._tokenizer = AutoTokenizer.from_pretrained(
+            self.model_name, local_files_only=self.local_files_only
+        )
+        # Left padding keeps the last position of every row aligned for decoding.
+        self._tokenizer.padding_side = "left"
+        if self._tokenizer.pad_token is None:
+            self._tokenizer.pad_token = self._tokenizer.eos_token
+        self._model = AutoModelForCausalLM.from_pretrained(
+            self.model_name, local_files_only=self.local_files_only
+        )
+        self._model.eval()
+
+    def _build_prompt(self, messages: List[Dict[str, str]]) -> str:
+        if getattr(self._tokenizer, "chat_template", None):
+            return self._tokenizer.apply_chat_template(messages, tokenize=False, add_generation_prompt=True)
+        prompt = "\n".join([f"{msg['role']}: {msg['content']}" for msg in messages])
+        return prompt + "\nassistant:"
+
+    def submit(
+        self,
+        messages: List[Dict[str, str]],
+        max_tokens: int = 1000,
+        temperature: float = 0.5
+    ) -> LocalGeneration:
+        """
+        Queues a chat request for generation and returns immediately.
+
+        Parameters:
+            messages (List[dict]): Chat messages with 'role' and 'content' keys.
+            max_tokens (int): Maximum number of new tokens to generate.
+            temperature (float): Sampling temperature; 0 selects greedy decoding.
+
+        Returns:
+            LocalGeneration: Handle used to stream or wait for the output.
+        """
+        if self._stopping:
+            raise RuntimeError("The local inference backend has been shut down.")
+        generation = LocalGeneration(messages, max_tokens, temperature)
+        generation.prompt = self._build_prompt(messages)
+        self._queue.put(generation)
+        return generation
+
+    def generate(
+        self,
+        messages: List[Dict[str, str]],
+        max_tokens: int = 1000,
+        temperature: float = 0.5
+    ) -> str:
+        return self.submit(messages, max_tokens, temperature).result()
+
+    def generate_stream(
+        self,
+        messages: List[Dict[str, str]],
+        max_tokens: int = 1000,
+        temperature: float = 0.5
+    ) -> Iterator[str]:
+        return self.submit(messages, max_tokens, temperature).stream()
+
+    def shutdown(self, timeout: Optional[float] = None):
+        """
+        Stops the scheduler thread after the batch in flight has finished.
+        Requests still waiting in the queue are failed.
+        """
+        self._stopping = True
+        self._queue.put(None)
+        self._worker.join(timeout)
+        while True:
+            try:
+                generation = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if generation is not None:
+                generation._finish(RuntimeError("The local inference backend has been shut down."))
+
+    def _collect_batch(self) -> Optional[List[LocalGeneration]]:
+        first = self._queue.get()
+        if first is None:
+            return None
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                generation = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if generation is None:
+                # Let the loop see the shutdown once this batch has run.
+                self._queue.put(None)
+                break
+            batch.append(generation)
+        return batch
+
+    def _scheduler_loop(self):
+        while True:
+            batch = self._collect_batch()
+            if batch is None:
+                break
+            # Requests cancelled while queued never reach the model.
+            batch = [generation for generation in batch if not generation.cancelled]
+            if not batch:
+                continue
+            self.batch_sizes.append(len(batch))
+            try:
+                self._run_batch(batch)
+            except Exception as e:
+                logger.error(f"Local generation failed: {e}")
+                for generation in batch:
+                    generation._finish(e)
+            else:
+                for generation in batch:
+                    generation._finish()
+
+    def _sample(self, logits, batch: List[LocalGeneration]):
+        torch = self._torch
+        temperatures = torch.tensor(
+            [generation.temperature for generation in batch], dtype=logits.dtype, device=logits.device
+        )
+        greedy = logits.argmax(dim=-1)
+        probs = torch.softmax(logits / temperatures.clamp(min=1e-5).unsqueeze(-1), dim=-1)
+        sampled = torch.multinomial(probs, num_samples=1).squeeze(-1)
+        return torch.where(temperatures > 0, sampled, greedy)
+
+    def _admit(self, free_rows: int) -> List[LocalGeneration]:
+        """
+        Takes up to `free_rows` queued requests without waiting, for joining the
+        running batch.
+        """
+        admitted = []
+        while len(admitted) < free_rows:
+            try:
+                generation = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if generation is None:
+                # Let the loop see the shutdown once this batch has drained.
+                self._queue.put(None)
+                break
+            if not generation.cancelled:
+                admitted.append(generation)
+        return admitted
+
+    def _prefill(self, generations: List[LocalGeneration]):
+        """
+        Runs the prompts of `generations` through the model as one left-padded batch.
+
+        Returns:
+            tuple: (logits, past_key_values, attention_mask, position_ids) where
+            position_ids holds the position of each row's next token.
+        """
+        encoded = self._tokenizer([generation.prompt for generation in generations], return_tensors="pt", padding=True)
+        attention_mask = encoded["attention_mask"]
+        position_ids = (attention_mask.cumsum(dim=-1) - 1).clamp(min=0)
+        outputs = self._model(
+            input_ids=encoded["input_ids"],
+            attention_mask=attention_mask,
+            position_ids=position_ids,
+            use_cache=True
+        )
+        return outputs.logits[:, -1, :], outputs.past_key_values, attention_mask, position_ids[:, -1:] + 1
+
+    @staticmethod
+    def _legacy_cache(past_key_values):
+        if hasattr(past_key_values, "to_legacy_cache"):
+            return past_key_values.to_legacy_cache()
+        return past_key_values
+
+    @staticmethod
+    def _rebuild_cache(like, layers):
+        if hasattr(like, "to_legacy_cache"):
+            return type(like).from_legacy_cache(tuple(layers))
+        return tuple(layers)
+
+    def _merge_rows(self, running, joining):
+        """
+        Stacks the decoding state of newly prefilled rows under the running ones.
+        The shorter side is left-padded with masked-out cache entries; keys keep the
+        rotary positions they were computed with, so padding does not shift them.
+        """
+        torch = self._torch
+        past, attention_mask, position_ids = running
+        new_past, new_mask, new_positions = joining
+        length = max(attention_mask.shape[1], new_mask.shape[1])
+
+        def pad(tensor, dim):
+            missing = length - tensor.shape[dim]
+            if missing == 0:
+                return tensor
+            shape = list(tensor.shape)
+            shape[dim] = missing
+            return torch.cat([tensor.new_zeros(shape), tensor], dim=dim)
+
+        layers = [
+            (torch.cat([pad(keys, 2), pad(new_keys, 2)]), torch.cat([pad(values, 2), pad(new_values, 2)]))
+            for (keys, values), (new_keys, new_values)
+            in zip(self._legacy_cache(past), self._legacy_cache(new_past))
+        ]
+        return (
+            self._rebuild_cache(past, layers),
+            torch.cat([pad(attention_mask, 1), pad(new_mask, 1)]),
+            torch.cat([position_ids, new_positions])
+        )
+
+    def _keep_rows(self, past, attention_mask, position_ids, rows: List[int]):
+        """
+        Drops finished rows from the decoding state, along with leading cache
+        columns that are padding for every row left.
+        """
+        index = self._torch.tensor(rows)
+        attention_mask = attention_mask[index]
+        start = int(attention_mask.any(dim=0).nonzero()[0])
+        layers = [
+            (keys[index, :, start:], values[index, :, start:]) for keys, values in self._legacy_cache(past)
+        ]
+        return self._rebuild_cache(past, layers), attention_mask[:, start:], position_ids[index]
+
+    def _run_batch(self, batch: List[LocalGeneration]):
+        """
+        Decodes `batch` until it and every request that joins it have finished.
+        Joining requests are appended to `batch`, so the caller can fail all of
+        them if decoding raises.
+        """
+        torch = self._torch
+        tokenizer = self._tokenizer
+        running: List[LocalGeneration] = []
+        generated: List[List[int]] = []
+        decoded: List[str] = []
+        next_ids = past_key_values = attention_mask = position_ids = None
+        joining = list(batch)
+
+        with torch.inference_mode():
+            while running or joining:
+                logits = []
+                if running:
+                    attention_mask = torch.cat([attention_mask, attention_mask.new_ones((len(running), 1))], dim=-1)
+                    outputs = self._model(
+                        input_ids=next_ids.unsqueeze(-1),
+                        attention_mask=attention_mask,
+                        position_ids=position_ids,
+                        past_key_values=past_key_values,
+                        use_cache=True
+                    )
+                    logits.append(outputs.logits[:, -1, :])
+                    past_key_values = outputs.past_key_values
+                    position_ids = position_ids + 1
+                if joining:
+                    new_logits, *state = self._prefill(joining)
+                    logits.append(new_logits)
+                    if running:
+                        past_key_values, attention_mask, position_ids = self._merge_rows(
+                            (past_key_values, attention_mask, position_ids), state
+                        )
+                    else:
+                        past_key_values, attention_mask, position_ids = state
+                    running.extend(joining)
+                    generated.extend([] for _ in joining)
+                    decoded.extend("" for _ in joining)
+                next_ids = self._sample(torch.cat(logits), running)
+
+                keep = []
+                for i, generation in enumerate(running):
+                    if generation.cancelled:
+                        # Already finished by cancel(); just stop spending steps on it.
+                        continue
+                    token_id = int(next_ids[i])
+                    if token_id == tokenizer.eos_token_id:
+                        generation._finish()
+                        continue
+                    generated[i].append(token_id)
+                    # Decode the whole sequence so multi-token characters come out intact.
+                    text = tokenizer.decode(generated[i], skip_special_tokens=True)
+                    generation._emit(text[len(decoded[i]):])
+                    decoded[i] = text
+                    if len(generated[i]) >= generation.max_tokens:
+                        generation._finish()
+                        continue
+                    keep.append(i)
+
+                if len(keep) < len(running):
+                    running = [running[i] for i in keep]
+                    generated = [generated[i] for i in keep]
+                    decoded = [decoded[i] for i in keep]
+                    if keep:
+                        next_ids = next_ids[torch.tensor(keep)]
+                        past_key_values, attention_mask, position_ids = self._keep_rows(
+                            past_key_values, attention_mask, position_ids, keep
+                        )
+
+                if not running:
+                    break
+                # Queued requests join between steps instead of waiting for this batch to drain.
+                joining = self._admit(self.max_batch_size - len(running))
+                self.joined_requests += len(joining)
+                batch.extend(joining)
+
+
+_shared_backends: Dict[str, LocalInferenceBackend] = {}
+_shared_backends_lock = threading.Lock()
+
+
+def get_local_backend(model_name: str = DEFAULT_LOCAL_MODEL, **kwargs) -> LocalInferenceBackend:
+    """
+    Returns the process-wide backend for `model_name`, loading the model the first
+    time it is requested so every NLPProcessor in the process shares one copy.
+    """
+    with _shared_backends_lock:
+        backend = _shared_backends.get(model_name)
+        if backend is None:
+            backend = LocalInferenceBackend(model_name=model_name, **kwargs)
+            _shared_backends[model_name] = backend
+        return backend
@@ -3,6 +3,12 @@ import logging
 import time
 from typing import List, Optional, Dict
 from .setup import load_config
+from .local_backend import DEFAULT_LOCAL_MODEL, get_local_backend
+from .doc_index import DEFAULT_INDEX_DIR, format_reference_context, load_doc_index
+from .rate_limiter import PRIORITY_DETAILED, PRIORITY_INTERACTIVE, get_rate_limiter
+from .tokens import estimate_message_tokens
+from .cancellation import CancellationToken, GenerationCancelled, cancellation_metrics
+from .instruction_generator import InstructionGenerator
 import os
 
 try:
@@ -14,14 +20,24 @@ except ImportError:
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+DETAILED_MAX_TOKENS = 1500
+# Expansion only writes additions to an existing answer, so it needs far less room
+EXPANSION_MAX_TOKENS = 700
+
 class NLPProcessor:
-    def __init__(self, config_path: str = 'config.json', model_provider: str = 'openai'):
+    def __init__(
+        self,
+        config_path: str = 'config.json',
+        model_provider: str = 'openai',
+        model: Optional[str] = None
+    ):
         """
-        Initializes the NLPProcessor with either OpenAI or Ollama based on the configuration.
+        Initializes the NLPProcessor with OpenAI, Ollama or a local model based on the configuration.
 
         Parameters:
             config_path (str): The path to the configuration file.
-            model_provider (str): The LLM provider to use ('openai' or 'ollama').
+            model_provider (str): The LLM provider to use ('openai', 'ollama' or 'local').
+            model (Optional[str]): Model name overriding the provider's default.
         """
         # Load configuration
         config = load_config(config_path)
@@ -45,18 +61,44 @@ class NLPProcessor:
                 openai.organization = self.org_id
             
             # Set the OpenAI model name
-            self.MODEL = "gpt-4o-mini"  # Update to your desired OpenAI model
+            self.MODEL = model or "gpt-4o-mini"  # Update to your desired OpenAI model
             logger.info("OpenAI API client initiated.")
         
         elif self.model_provider == 'ollama':
             # Ensure the Ollama module is available
             if ollama is None:
                 raise ImportError("The Ollama package is not installed. Please install it to use Ollama as the model provider.")
-            self.MODEL = "llama2"  # Update to your desired Ollama model
+            self.MODEL = model or "llama2"  # Update to your desired Ollama model
             logger.info("Ollama API client initiated.")
         
+        elif self.model_provider == 'local':
+            # Runs fully offline; the model is loaded once and shared across the process
+            self.MODEL = model or config.get('LOCAL_MODEL', DEFAULT_LOCAL_MODEL)
+            self.local_backend = get_local_backend(
+                self.MODEL,
+                max_batch_size=config.get('LOCAL_MAX_BATCH_SIZE', 8),
+                max_wait_ms=config.get('LOCAL_MAX_WAIT_MS', 10.0)
+            )
+            logger.info("Local inference backend initiated.")
+        
         else:
-            raise ValueError("Invalid model provider. Please use 'openai' or 'ollama'.")
+            raise ValueError("Invalid model provider. Please use 'openai', 'ollama' or 'local'.")
+        
+        # Sampling defaults; see datawizzy.sweep for choosing them
+        self.temperature = config.get('TEMPERATURE', 0.5)
+        self.presence_penalty = config.get('PRESENCE_PENALTY', 0.6)
+        # Latency of the first streamed token of the last call, when the provider streamed
+        self.last_time_to_first_token: Optional[float] = None
+        
+        # Optional offline API reference used to ground prompts (see datawizzy.doc_index)
+        self.doc_index = load_doc_index(config.get('DOC_INDEX_PATH', DEFAULT_INDEX_DIR))
+        self.doc_context_snippets = config.get('DOC_CONTEXT_SNIPPETS', 3)
+        self.doc_context_tokens = config.get('DOC_CONTEXT_TOKENS', 200)
+        
+        # Optional shared RPM/TPM scheduler in front of the provider
+        self.rate_limiter = None
+        if config.get('RATE_LIMIT_RPM') and config.get('RATE_LIMIT_TPM'):
+            self.rate_limiter = get_rate_limiter(config['RATE_LIMIT_RPM'], config['RATE_LIMIT_TPM'])
 
     def _validate_inputs(
         self,
@@ -86,6 +128,29 @@ class NLPProcessor:
                     logger.error("Each message in conversation_history must be a dict with 'role' and 'content' keys.")
                     raise ValueError("Each message must be a dict with 'role' and 'content'.")
 
+    def _reference_context(self, query: str) -> str:
+        """
+        Retrieves API snippets relevant to the query from the documentation index.
+
+        Returns:
+            str: A reference block for the system prompt, or an empty string if no
+            index is available or nothing relevant fits the token budget.
+        """
+        if self.doc_index is None:
+            return ""
+        try:
+            snippets = self.doc_index.search(query, k=self.doc_context_snippets)
+        except Exception as e:
+            logger.warning(f"Documentation lookup failed: {e}")
+            return ""
+        return format_reference_context(snippets, self.doc_context_tokens)
+
+    def _system_message(self, content: str, query: str) -> Dict[str, str]:
+        reference = self._reference_context(query)
+        if reference:
+            content = f"{content}\n\n{reference}"
+        return {"role": "system", "content": content}
+
     def _generate_response_openai(
         self,
         messages: List[Dict[str, str]],
@@ -94,61 +159,197 @@ class NLPProcessor:
         top_p: float,
         frequency_penalty: float,
         presence_penalty: float,
-        stop: Optional[List[str]]
+        stop: Optional[List[str]],
+        cancel_token: Optional[CancellationToken] = None
     ) -> str:
-        response = openai.ChatCompletion.create(
-            model=self.MODEL,
-            messages=messages,
-            max_tokens=max_tokens,
-            temperature=temperature,
-            top_p=top_p,
-            frequency_penalty=frequency_penalty,
-            presence_penalty=presence_penalty,
-            stop=stop
-        )
-        return response.choices[0].message['content'].strip()
+        if cancel_token is None:
+            response = openai.ChatCompletion.create(
+                model=self.MODEL,
+                messages=messages,
+                max_tokens=max_tokens,
+                temperature=temperature,
+                top_p=top_p,
+                frequency_penalty=frequency_penalty,
+                presence_penalty=presence_penalty,
+                stop=stop
+            )
+            return response.choices[0].message['content'].strip()
+        
+        # Stream so the request can be abandoned part-way once the token is cancelled
+        started = time.perf_counter()
+        response = None
+        chunks = []
+        try:
+            response = openai.ChatCompletion.create(
+                model=self.MODEL,
+                messages=messages,
+                max_tokens=max_tokens,
+                temperature=temperature,
+                top_p=top_p,
+                frequency_penalty=frequency_penalty,
+                presence_penalty=presence_penalty,
+                stop=stop,
+                stream=True,
+                request_timeout=cancel_token.remaining()
+            )
+            for chunk in response:
+                cancel_token.raise_if_cancelled(tokens_generated=len(chunks))
+                content = chunk['choices'][0]['delta'].get('content')
+                if content:
+                    if not chunks:
+                        self.last_time_to_first_token = time.perf_counter() - started
+                    chunks.append(content)
+        except GenerationCancelled:
+            raise
+        except Exception as e:
+            # The request timeout is the token's deadline, so hitting it is a cancellation.
+            # A read timeout mid-stream surfaces from requests rather than as openai.error.Timeout.
+            if isinstance(e, openai.error.Timeout) or cancel_token.cancelled:
+                cancel_token.cancel("deadline exceeded")
+                raise GenerationCancelled(cancel_token.reason, len(chunks)) from e
+            raise
+        finally:
+            close = getattr(response, 'close', None)
+            if close is not None:
+                close()
+        return "".join(chunks).strip()
 
     def _generate_response_ollama(
         self,
         prompt: str,
-        max_tokens: int
+        max_tokens: int,
+        temperature: float,
+        presence_penalty: float,
+        cancel_token: Optional[CancellationToken] = None
+    ) -> str:
+        options = {'num_predict': max_tokens, 'temperature': temperature, 'presence_penalty': presence_penalty}
+        if cancel_token is None:
+            response = ollama.generate(model=self.MODEL, prompt=prompt, options=options)
+            return response["response"].strip()
+        
+        # Stream so the request can be abandoned part-way; closing the stream stops the server generating
+        started = time.perf_counter()
+        response = ollama.generate(model=self.MODEL, prompt=prompt, options=options, stream=True)
+        chunks = []
+        try:
+            for chunk in response:
+                cancel_token.raise_if_cancelled(tokens_generated=len(chunks))
+                content = chunk.get('response')
+                if content:
+                    if not chunks:
+                        self.last_time_to_first_token = time.perf_counter() - started
+                    chunks.append(content)
+        finally:
+            close = getattr(response, 'close', None)
+            if close is not None:
+                close()
+        return "".join(chunks).strip()
+
+    def _generate_response_local(
+        self,
+        messages: List[Dict[str, str]],
+        max_tokens: int,
+        temperature: float,
+        cancel_token: Optional[CancellationToken] = None
     ) -> str:
-        # Assuming Ollama supports similar parameters; adjust as needed.
-        response = ollama.complete(model=self.MODEL, prompt=prompt, max_tokens=max_tokens)
-        return response["response"]
+        generation = self.local_backend.submit(messages, max_tokens=max_tokens, temperature=temperature)
+        if cancel_token is None:
+            response = generation.result()
+        else:
+            # Cancelling the token drops the request from its batch at the next decoding step
+            handle = cancel_token.add_callback(lambda: generation.cancel(cancel_token.reason or "cancelled"))
+            try:
+                response = generation.result(timeout=cancel_token.remaining())
+            except TimeoutError:
+                generation.cancel("deadline exceeded")
+                raise GenerationCancelled("deadline exceeded", generation.num_tokens)
+            finally:
+                cancel_token.remove_callback(handle)
+        if generation.first_token_at is not None:
+            self.last_time_to_first_token = generation.first_token_at - generation.submitted_at
+        return response
 
     def _generate_response(
         self,
         messages: List[Dict[str, str]],
         max_tokens: int = 1000,
-        temperature: float = 0.5,
+        temperature: Optional[float] = None,
         top_p: float = 1.0,
         frequency_penalty: float = 0.0,
-        presence_penalty: float = 0.6,
-        stop: Optional[List[str]] = None
+        presence_penalty: Optional[float] = None,
+        stop: Optional[List[str]] = None,
+        priority: int = PRIORITY_INTERACTIVE,
+        user: Optional[str] = None,
+        cancel_token: Optional[CancellationToken] = None
     ) -> str:
         """
-        Generates a response using either OpenAI or Ollama based on the selected model provider.
+        Generates a response using OpenAI, Ollama or the local model based on the selected model provider.
+
+        When rate limiting is configured, the call first waits for RPM/TPM capacity in
+        its priority class; the token cost is estimated from the prompt and max_tokens.
+
+        Raises:
+            GenerationCancelled: If `cancel_token` is cancelled or its deadline passes
+                before the response is complete.
         """
+        if temperature is None:
+            temperature = self.temperature
+        if presence_penalty is None:
+            presence_penalty = self.presence_penalty
+        self.last_time_to_first_token = None
+        
         prompt = "\n".join([f"{msg['role']}: {msg['content']}" for msg in messages])
+        prompt_tokens = estimate_message_tokens(messages)
+        sent = False
         
-        if self.model_provider == 'openai':
-            return self._generate_response_openai(
-                messages, max_tokens, temperature, top_p, frequency_penalty, presence_penalty, stop
-            )
-        elif self.model_provider == 'ollama':
-            return self._generate_response_ollama(prompt, max_tokens)
-        else:
-            raise ValueError("Unsupported model provider.")
+        try:
+            if cancel_token is not None:
+                cancel_token.raise_if_cancelled()
+            
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire(
+                    prompt_tokens + max_tokens, priority=priority, user=user, cancel_token=cancel_token
+                )
+            
+            sent = True
+            if self.model_provider == 'openai':
+                return self._generate_response_openai(
+                    messages, max_tokens, temperature, top_p, frequency_penalty, presence_penalty, stop, cancel_token
+                )
+            elif self.model_provider == 'ollama':
+                return self._generate_response_ollama(prompt, max_tokens, temperature, presence_penalty, cancel_token)
+            elif self.model_provider == 'local':
+                return self._generate_response_local(messages, max_tokens, temperature, cancel_token)
+            else:
+                raise ValueError("Unsupported model provider.")
+        except GenerationCancelled as e:
+            # Cancelled before sending saves the whole call; afterwards only the unwritten completion
+            tokens_saved = max_tokens - e.tokens_generated if sent else prompt_tokens + max_tokens
+            cancellation_metrics.record(tokens_saved)
+            logger.info(f"Generation {e.reason}; about {max(0, tokens_saved)} tokens saved.")
+            raise
+        except KeyboardInterrupt:
+            # Ctrl-C lands in this thread; stop any work running elsewhere on our behalf
+            if cancel_token is not None:
+                cancel_token.cancel("interrupted")
+            cancellation_metrics.record(max_tokens if sent else prompt_tokens + max_tokens)
+            raise
 
     def generate_concise_response(
         self,
         query: str,
         conversation_history: Optional[List[Dict[str, str]]] = None,
-        max_tokens: int = 300  # Reduced tokens for concise response
+        max_tokens: int = 300,  # Reduced tokens for concise response
+        priority: int = PRIORITY_INTERACTIVE,
+        user: Optional[str] = None,
+        cancel_token: Optional[CancellationToken] = None
     ) -> str:
         """
         Generates a concise and generalized response based on the user's query.
+
+        Batch or speculative callers should pass priority=PRIORITY_BACKGROUND so they
+        yield to interactive users when rate limiting is configured. Pass a
+        CancellationToken to abandon the call once its answer is no longer wanted.
         """
         # Set default conversation_history to empty list if None
         if conversation_history is None:
@@ -158,7 +359,10 @@ class NLPProcessor:
         self._validate_inputs(query, conversation_history)
         
         messages = [
-            {"role": "system", "content": "You are an AI assistant specializing in data science and Python programming. Provide clear and concise explanations."}
+            self._system_message(
+                "You are an AI assistant specializing in data science and Python programming. Provide clear and concise explanations.",
+                query
+            )
         ]
         
         if conversation_history:
@@ -172,16 +376,27 @@ class NLPProcessor:
         )
         messages.append({"role": "user", "content": user_prompt})
         
-        return self._generate_response(messages, max_tokens=max_tokens)
+        return self._generate_response(
+            messages, max_tokens=max_tokens, priority=priority, user=user, cancel_token=cancel_token
+        )
 
     def generate_detailed_instructions(
         self,
         query: str,
         conversation_history: Optional[List[Dict[str, str]]] = None,
-        max_tokens: int = 1500
+        max_tokens: Optional[int] = None,
+        priority: int = PRIORITY_DETAILED,
+        user: Optional[str] = None,
+        cancel_token: Optional[CancellationToken] = None,
+        previous_response: Optional[str] = None
     ) -> str:
         """
         Generates a more detailed, in-depth instructional guide based on the user's query.
+
+        If `previous_response` (the concise answer already shown) is given, the model is
+        only asked for additions to each of its steps, which are merged into the
+        previous answer locally. This produces the same kind of guide with far fewer
+        output tokens than regenerating it from scratch.
         """
         # Set default conversation_history to empty list if None
         if conversation_history is None:
@@ -190,8 +405,17 @@ class NLPProcessor:
         # Validate inputs
         self._validate_inputs(query, conversation_history)
         
+        if previous_response and previous_response.strip():
+            return self._expand_previous_response(
+                query, previous_response, conversation_history,
+                max_tokens or EXPANSION_MAX_TOKENS, priority, user, cancel_token
+            )
+        
         messages = [
-            {"role": "system", "content": "You are an AI assistant specializing in data science and Python programming."}
+            self._system_message(
+                "You are an AI assistant specializing in data science and Python programming.",
+                query
+            )
         ]
         
         if conversation_history:
@@ -206,4 +430,50 @@ class NLPProcessor:
         )
         messages.append({"role": "user", "content": user_prompt})
         
-        return self._generate_response(messages, max_tokens=max_tokens)
\ No newline at end of file
+        return self._generate_response(
+            messages, max_tokens=max_tokens or DETAILED_MAX_TOKENS, priority=priority, user=user, cancel_token=cancel_token
+        )
+
+    def _expand_previous_response(
+        self,
+        query: str,
+        previous_response: str,
+        conversation_history: List[Dict[str, str]],
+        max_tokens: int,
+        priority: int,
+        user: Optional[str],
+        cancel_token: Optional[CancellationToken]
+    ) -> str:
+        generator = InstructionGenerator()
+        intro, steps = generator.split_steps(previous_response)
+        
+        messages = [
+            self._system_message(
+                "You are an AI assistant specializing in data science and Python programming.",
+                query
+            )
+        ]
+        
+        # The previous answer is restated below as numbered steps; don't send it twice
+        messages.extend(
+            message for message in conversation_history
+            if message['content'].strip() != previous_response.strip()
+        )
+        
+        messages.append({"role": "user", "content": query})
+        
+        numbered_steps = "\n\n".join(f"Step {number}:\n{step}" for number, step in enumerate(steps, start=1))
+        user_prompt = (
+            "The user has requested more detailed instructions. You already gave this answer:\n\n"
+            f"{numbered_steps}\n\n"
+            "Do not repeat it. For each step that needs it, write only what is missing: additional code snippets, "
+            "in-depth explanation, best practices and potential pitfalls. Put each addition under a heading "
+            "'### Step N' matching the step it belongs to, skip steps that need nothing, and put any new steps "
+            "under '### Additional steps'."
+        )
+        messages.append({"role": "user", "content": user_prompt})
+        
+        expansion = self._generate_response(
+            messages, max_tokens=max_tokens, priority=priority, user=user, cancel_token=cancel_token
+        )
+        return generator.merge_expansion(intro, steps, expansion)
@@ -0,0 +1,234 @@
+import logging
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Dict, Optional
+
+from .cancellation import CancellationToken
+
+logger = logging.getLogger(__name__)
+
+# Priority classes, most urgent first.
+PRIORITY_INTERACTIVE = 0
+PRIORITY_DETAILED = 1
+PRIORITY_BACKGROUND = 2
+
+PRIORITY_NAMES = {
+    PRIORITY_INTERACTIVE: 'interactive',
+    PRIORITY_DETAILED: 'detailed',
+    PRIORITY_BACKGROUND: 'background',
+}
+
+
+class TokenBucket:
+    def __init__(self, rate_per_minute: float, burst_seconds: float = 60.0):
+        """
+        Token bucket refilled continuously at `rate_per_minute`.
+
+        Parameters:
+            rate_per_minute (float): Sustained rate the bucket allows.
+            burst_seconds (float): How many seconds' worth of the rate can be spent at once.
+        """
+        if rate_per_minute <= 0:
+            raise ValueError("rate_per_minute must be positive.")
+        self.rate = rate_per_minute / 60.0
+        self.capacity = max(1.0, self.rate * burst_seconds)
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def time_until(self, amount: float, now: float) -> float:
+        """
+        Seconds until `amount` can be consumed (0 if it can be consumed now).
+        """
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        if self.level >= amount:
+            return 0.0
+        return (amount - self.level) / self.rate
+
+    def consume(self, amount: float, now: float):
+        self._refill(now)
+        # Requests bigger than the bucket are let through once it is full rather than never.
+        self.level -= min(amount, self.capacity)
+
+
+class _Waiter:
+    __slots__ = ('priority', 'user', 'cost', 'enqueued_at')
+
+    def __init__(self, priority: int, user: str, cost: int):
+        self.priority = priority
+        self.user = user
+        self.cost = cost
+        self.enqueued_at = time.monotonic()
+
+
+class RateLimitScheduler:
+    def __init__(
+        self,
+        requests_per_minute: float,
+        tokens_per_minute: float,
+        burst_seconds: float = 60.0
+    ):
+        """
+        Admits provider calls against requests/min and tokens/min budgets.
+
+        Waiting calls are served strictly by priority class, and round-robin across
+        users within a class, so one user's batch job cannot hold up everyone else.
+
+        Parameters:
+            requests_per_minute (float): Request quota (RPM).
+            tokens_per_minute (float): Token quota (TPM), counting prompt and completion.
+            burst_seconds (float): How many seconds' worth of quota may be spent at once.
+        """
+        self.requests = TokenBucket(requests_per_minute, burst_seconds)
+        self.tokens = TokenBucket(tokens_per_minute, burst_seconds)
+
+        self._condition = threading.Condition()
+        # priority -> user -> queue of waiters; user order is the round-robin order
+        self._queues: Dict[int, "OrderedDict[str, deque]"] = {
+            priority: OrderedDict() for priority in PRIORITY_NAMES
+        }
+        self._stats = {
+            priority: {'admitted': 0, 'total_wait': 0.0, 'max_wait': 0.0}
+            for priority in PRIORITY_NAMES
+        }
+
+    def _head(self) -> Optional[_Waiter]:
+        for priority in sorted(self._queues):
+            users = self._queues[priority]
+            if users:
+                return next(iter(users.values()))[0]
+        return None
+
+    def _pop(self, waiter: _Waiter):
+        users = self._queues[waiter.priority]
+        pending = users.pop(waiter.user)
+        pending.popleft()
+        if pending:
+            # The user goes to the back of the round-robin order.
+            users[waiter.user] = pending
+
+    def acquire(
+        self,
+        estimated_tokens: int,
+        priority: int = PRIORITY_INTERACTIVE,
+        user: Optional[str] = None,
+        timeout: Optional[float] = None,
+        cancel_token: Optional[CancellationToken] = None
+    ) -> float:
+        """
+        Blocks until the call may be sent to the provider.
+
+        Parameters:
+            estimated_tokens (int): Expected prompt plus completion tokens.
+            priority (int): One of the PRIORITY_* classes.
+            user (Optional[str]): Identifier used for fair queuing between users.
+            timeout (Optional[float]): Maximum seconds to wait.
+            cancel_token (Optional[CancellationToken]): Abandons the wait when cancelled
+                or when its deadline passes.
+
+        Returns:
+            float: Seconds spent waiting.
+
+        Raises:
+            ValueError: If the priority class is unknown.
+            TimeoutError: If the call was not admitted within `timeout` seconds.
+            GenerationCancelled: If `cancel_token` was cancelled while waiting.
+        """
+        if priority not in self._queues:
+            raise ValueError(f"Unknown priority class: {priority}")
+        waiter = _Waiter(priority, user or 'anonymous', max(1, int(estimated_tokens)))
+        deadline = None if timeout is None else waiter.enqueued_at + timeout
+        if cancel_token is not None:
+            if cancel_token.deadline is not None:
+                deadline = cancel_token.deadline if deadline is None else min(deadline, cancel_token.deadline)
+            callback = cancel_token.add_callback(self._wake)
+
+        with self._condition:
+            self._queues[priority].setdefault(waiter.user, deque()).append(waiter)
+            try:
+                while True:
+                    now = time.monotonic()
+                    if cancel_token is not None:
+                        cancel_token.raise_if_cancelled()
+                    if self._head() is waiter:
+                        delay = max(self.requests.time_until(1, now), self.tokens.time_until(waiter.cost, now))
+                        if delay == 0:
+                            break
+                    else:
+                        delay = None
+                    if deadline is not None:
+                        remaining = deadline - now
+                        if remaining <= 0:
+                            if cancel_token is not None:
+                                cancel_token.raise_if_cancelled()
+                            raise TimeoutError("Timed out waiting for rate limit capacity.")
+                        delay = remaining if delay is None else min(delay, remaining)
+                    self._condition.wait(delay)
+            except BaseException:
+                self._queues[priority][waiter.user].remove(waiter)
+                if not self._queues[priority][waiter.user]:
+                    del self._queues[priority][waiter.user]
+                self._condition.notify_all()
+                raise
+            finally:
+                if cancel_token is not None:
+                    cancel_token.remove_callback(callback)
+
+            self._pop(waiter)
+            self.requests.consume(1, now)
+            self.tokens.consume(waiter.cost, now)
+
+            waited = now - waiter.enqueued_at
+            stats = self._stats[priority]
+            stats['admitted'] += 1
+            stats['total_wait'] += waited
+            stats['max_wait'] = max(stats['max_wait'], waited)
+            self._condition.notify_all()
+
+        if waited > 1.0:
+            logger.info(f"Rate limited {PRIORITY_NAMES[priority]} request for {waited:.1f}s.")
+        return waited
+
+    def _wake(self):
+        with self._condition:
+            self._condition.notify_all()
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """
+        Returns queue depth and wait-time statistics per priority class.
+        """
+        with self._condition:
+            report = {}
+            for priority, name in PRIORITY_NAMES.items():
+                stats = self._stats[priority]
+                admitted = stats['admitted']
+                report[name] = {
+                    'queue_depth': sum(len(pending) for pending in self._queues[priority].values()),
+                    'admitted': admitted,
+                    'avg_wait': stats['total_wait'] / admitted if admitted else 0.0,
+                    'max_wait': stats['max_wait'],
+                }
+            return report
+
+
+_shared_schedulers: Dict[tuple, RateLimitScheduler] = {}
+_shared_schedulers_lock = threading.Lock()
+
+
+def get_rate_limiter(requests_per_minute: float, tokens_per_minute: float) -> RateLimitScheduler:
+    """
+    Returns the process-wide scheduler for the given quota so every NLPProcessor
+    drawing on the same account shares one set of buckets.
+    """
+    key = (requests_per_minute, tokens_per_minute)
+    with _shared_schedulers_lock:
+        scheduler = _shared_schedulers.get(key)
+        if scheduler is None:
+            scheduler = RateLimitScheduler(requests_per_minute, tokens_per_minute)
+            _shared_schedulers[key] = scheduler
+        return scheduler
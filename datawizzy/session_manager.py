@@ -0,0 +1,213 @@
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, List
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SESSION_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'datawizzy', 'sessions')
+
+# Rough per-message cost of the dict, its keys and string headers, in bytes.
+MESSAGE_OVERHEAD_BYTES = 240
+
+
+def message_bytes(message: Dict[str, str]) -> int:
+    """
+    Approximates the memory held by one chat message.
+    """
+    return MESSAGE_OVERHEAD_BYTES + sum(len(str(value)) for value in message.values())
+
+
+class ManagedSession:
+    """
+    One user's conversation. Every message is appended to an on-disk log as it
+    arrives; only the most recent turns that fit the memory cap stay in memory.
+    """
+
+    def __init__(self, session_id: str, log_path: str, max_bytes: int, min_messages: int = 2):
+        self.session_id = session_id
+        self.log_path = log_path
+        self.max_bytes = max_bytes
+        self.min_messages = min_messages
+        self.messages: deque = deque()
+        # Keyed by absolute message index, so entries survive older turns being offloaded.
+        self.detailed_requested: Dict[int, bool] = {}
+        self.offloaded_count = 0
+        self.last_active = 0.0
+        self._bytes = 0
+        self._restore()
+
+    def _restore(self):
+        if not os.path.exists(self.log_path):
+            return
+        with open(self.log_path, 'r') as f:
+            for line in f:
+                if line.strip():
+                    self.messages.append(json.loads(line))
+                    self._bytes += message_bytes(self.messages[-1])
+                    self.enforce_cap()
+
+    @property
+    def memory_bytes(self) -> int:
+        return self._bytes
+
+    def append(self, message: Dict[str, str]):
+        with open(self.log_path, 'a') as f:
+            f.write(json.dumps(message) + "\n")
+        self.messages.append(message)
+        self._bytes += message_bytes(message)
+        self.enforce_cap()
+
+    def enforce_cap(self):
+        """
+        Drops the oldest in-memory turns (they are already on disk) until the session
+        fits its cap, always keeping the latest `min_messages`.
+        """
+        while self._bytes > self.max_bytes and len(self.messages) > self.min_messages:
+            self._bytes -= message_bytes(self.messages.popleft())
+            self.offloaded_count += 1
+        for index in [i for i in self.detailed_requested if i < self.offloaded_count]:
+            del self.detailed_requested[index]
+
+    def all_messages(self) -> List[Dict[str, str]]:
+        """
+        Returns the full conversation, reading offloaded turns back from disk.
+        """
+        if not self.offloaded_count:
+            return list(self.messages)
+        with open(self.log_path, 'r') as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+    def replace_messages(self, messages: List[Dict[str, str]]):
+        """
+        Replaces the whole conversation, e.g. when loading a saved one.
+        """
+        with open(self.log_path, 'w') as f:
+            for message in messages:
+                f.write(json.dumps(message) + "\n")
+        self.messages = deque(messages)
+        self._bytes = sum(message_bytes(message) for message in messages)
+        self.detailed_requested = {}
+        self.offloaded_count = 0
+        self.enforce_cap()
+
+
+class SessionManager:
+    def __init__(
+        self,
+        storage_dir: str = DEFAULT_SESSION_DIR,
+        max_session_bytes: int = 256 * 1024,
+        idle_timeout: float = 30 * 60,
+        eviction_interval: float = 60.0,
+        log_retention: float = 24 * 60 * 60,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        """
+        Keeps per-session conversation state bounded for a long-running server.
+
+        Parameters:
+            storage_dir (str): Directory holding one message log per session.
+            max_session_bytes (int): Approximate in-memory cap per session; older
+                turns beyond it are served from the log.
+            idle_timeout (float): Seconds without activity after which a session is
+                evicted from memory. Its log is kept, so it is restored on return.
+            eviction_interval (float): Minimum seconds between idle sweeps.
+            log_retention (float): Seconds after its last message that an evicted
+                session's log is deleted, so conversations are not kept on disk
+                indefinitely.
+            clock (Callable[[], float]): Time source, replaceable in tests.
+        """
+        self.storage_dir = storage_dir
+        self.max_session_bytes = max_session_bytes
+        self.idle_timeout = idle_timeout
+        self.eviction_interval = eviction_interval
+        self.log_retention = log_retention
+        self.clock = clock
+        self._sessions: Dict[str, ManagedSession] = {}
+        self._lock = threading.Lock()
+        self._last_eviction = clock()
+        os.makedirs(storage_dir, exist_ok=True)
+        # Clears out logs left behind by earlier runs of the server
+        self._expire_logs()
+
+    def _log_path(self, session_id: str) -> str:
+        safe_id = re.sub(r"[^A-Za-z0-9_.-]", "_", session_id)
+        return os.path.join(self.storage_dir, f"{safe_id}.jsonl")
+
+    def get(self, session_id: str) -> ManagedSession:
+        """
+        Returns the session for `session_id`, restoring it from its log if it was
+        evicted, and marks it active.
+        """
+        with self._lock:
+            now = self.clock()
+            if now - self._last_eviction >= self.eviction_interval:
+                self._evict_idle(now)
+            session = self._sessions.get(session_id)
+            if session is None:
+                session = ManagedSession(session_id, self._log_path(session_id), self.max_session_bytes)
+                self._sessions[session_id] = session
+            session.last_active = now
+            return session
+
+    def _evict_idle(self, now: float) -> List[str]:
+        self._last_eviction = now
+        idle = [
+            session_id for session_id, session in self._sessions.items()
+            if now - session.last_active > self.idle_timeout
+        ]
+        for session_id in idle:
+            del self._sessions[session_id]
+        if idle:
+            logger.info(f"Evicted {len(idle)} idle sessions; {len(self._sessions)} remain.")
+        self._expire_logs()
+        return idle
+
+    def _expire_logs(self) -> int:
+        # Log age comes from the file's modification time, i.e. its last appended message
+        live = {session.log_path for session in self._sessions.values()}
+        cutoff = time.time() - self.log_retention
+        expired = 0
+        for entry in os.scandir(self.storage_dir):
+            if not entry.name.endswith('.jsonl') or entry.path in live:
+                continue
+            try:
+                if entry.stat().st_mtime <= cutoff:
+                    os.remove(entry.path)
+                    expired += 1
+            except FileNotFoundError:
+                pass
+        if expired:
+            logger.info(f"Deleted {expired} expired session logs.")
+        return expired
+
+    def evict_idle(self) -> List[str]:
+        """
+        Evicts sessions idle for longer than the timeout and deletes logs past
+        their retention.
+
+        Returns:
+            List[str]: The evicted session ids.
+        """
+        with self._lock:
+            return self._evict_idle(self.clock())
+
+    def discard(self, session_id: str, delete_log: bool = False):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+        if delete_log and os.path.exists(self._log_path(session_id)):
+            os.remove(self._log_path(session_id))
+
+    def memory_report(self) -> Dict[str, int]:
+        """
+        Returns the approximate in-memory size of each live session, in bytes.
+        """
+        with self._lock:
+            return {session_id: session.memory_bytes for session_id, session in self._sessions.items()}
+
+    def __len__(self) -> int:
+        return len(self._sessions)
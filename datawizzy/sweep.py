@@ -0,0 +1,359 @@
+import argparse
+import ast
+import hashlib
+import itertools
+import json
+import logging
+import os
+import random
+import re
+import time
+from typing import Dict, Iterable, List, NamedTuple, Optional
+
+from .cancellation import CancellationToken
+from .instruction_generator import InstructionGenerator
+from .safety import SafetyChecker
+from .tokens import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+# Fixed corpus of data-science queries and the APIs a good answer should mention.
+DEFAULT_CORPUS = [
+    {"query": "How do I drop rows with missing values from a pandas DataFrame?",
+     "expected_apis": ["dropna", "isna"]},
+    {"query": "How can I fill missing values in a column with the column mean?",
+     "expected_apis": ["fillna", "mean"]},
+    {"query": "How do I load a CSV file and look at the first rows?",
+     "expected_apis": ["read_csv", "head"]},
+    {"query": "How do I group a DataFrame by one column and average another?",
+     "expected_apis": ["groupby", "mean"]},
+    {"query": "How do I merge two DataFrames on a shared key?",
+     "expected_apis": ["merge"]},
+    {"query": "How can I plot a histogram of a column with matplotlib?",
+     "expected_apis": ["hist", "plt.show"]},
+    {"query": "How do I draw a scatter plot of two columns?",
+     "expected_apis": ["scatter", "plt.show"]},
+    {"query": "How do I compute a correlation matrix and show it as a heatmap?",
+     "expected_apis": ["corr", "heatmap"]},
+    {"query": "How do I convert a string column to datetime and resample by month?",
+     "expected_apis": ["to_datetime", "resample"]},
+    {"query": "How do I remove duplicate rows from a DataFrame?",
+     "expected_apis": ["drop_duplicates"]},
+]
+
+
+class SweepConfig(NamedTuple):
+    model: str
+    max_tokens: int
+    temperature: float
+    presence_penalty: float
+
+    @property
+    def label(self) -> str:
+        return f"{self.model} max_tokens={self.max_tokens} temp={self.temperature:g} presence={self.presence_penalty:g}"
+
+
+class SweepGeneration(NamedTuple):
+    text: str
+    time_to_first_token: Optional[float]
+    latency: float
+
+
+class MockBackend:
+    """
+    Deterministic offline stand-in for a provider. Responses and timings are
+    derived from a hash of the query and configuration, and larger token budgets
+    and lower temperatures produce better answers, so the harness itself can be
+    exercised without network access or a model. Its numbers are built in and say
+    nothing about real models.
+    """
+
+    # (seconds to first token, tokens per second) per model; unknown models use the default.
+    PROFILES = {
+        "gpt-4o-mini": (0.35, 90.0),
+        "gpt-4o": (0.6, 45.0),
+        "llama2": (0.8, 25.0),
+    }
+    DEFAULT_PROFILE = (0.5, 50.0)
+
+    def __init__(self, corpus: List[Dict] = DEFAULT_CORPUS):
+        self._expected = {item['query']: item.get('expected_apis', []) for item in corpus}
+
+    def generate(self, query: str, config: SweepConfig) -> SweepGeneration:
+        seed = hashlib.sha256(f"{query}|{config}".encode('utf-8')).hexdigest()
+        rng = random.Random(seed)
+        apis = self._expected.get(query, [])
+        covered = apis[:max(1, len(apis) * config.max_tokens // 600)] if apis else []
+
+        lines = ["1. Import the libraries:", "```python", "import pandas as pd", "import matplotlib.pyplot as plt", "```"]
+        for number, api in enumerate(covered, start=2):
+            lines.append(f"{number}. Use `{api}`:")
+            lines.extend(["```python", f"result = df.{api}()", "```"])
+        if rng.random() < config.temperature * 0.4:
+            lines.extend(["```python", "result = df.(", "```"])
+        filler_tokens = int(config.max_tokens * (0.5 + 0.3 * rng.random()) * (1 - config.presence_penalty * 0.2))
+        # Each "details " is two estimated tokens
+        lines.append("Explanation: " + "details " * max(0, (filler_tokens - 40) // 2))
+        text = "\n".join(lines)
+
+        first_token, tokens_per_second = self.PROFILES.get(config.model, self.DEFAULT_PROFILE)
+        latency = first_token + estimate_tokens(text) / tokens_per_second
+        return SweepGeneration(text, first_token, latency)
+
+
+# Sampling parameters a provider does not apply; sweeping them would only relabel identical runs.
+IGNORED_PARAMETERS = {
+    'local': ('presence_penalty',),
+}
+
+
+class ProcessorBackend:
+    def __init__(self, config_path: str = 'config.json', provider: str = 'openai'):
+        """
+        Runs the sweep against real NLPProcessors. One processor is built per model,
+        since some providers (the local backend) load their model at construction.
+
+        Parameters:
+            config_path (str): DataWizzy configuration file.
+            provider (str): Model provider ('openai', 'ollama' or 'local').
+        """
+        self.config_path = config_path
+        self.provider = provider
+        self._processors = {}
+
+    def check_grid(self, grid: List[SweepConfig]):
+        """
+        Raises:
+            ValueError: If the grid varies a parameter the provider ignores.
+        """
+        for parameter in IGNORED_PARAMETERS.get(self.provider, ()):
+            if len({getattr(config, parameter) for config in grid}) > 1:
+                raise ValueError(f"The {self.provider} provider ignores {parameter}; sweep a single value.")
+
+    def _processor(self, model: str):
+        if model not in self._processors:
+            from .nlp_processor import NLPProcessor
+            self._processors[model] = NLPProcessor(
+                config_path=self.config_path, model_provider=self.provider, model=model
+            )
+        return self._processors[model]
+
+    def generate(self, query: str, config: SweepConfig) -> SweepGeneration:
+        nlp = self._processor(config.model)
+        nlp.temperature = config.temperature
+        nlp.presence_penalty = config.presence_penalty
+        start = time.perf_counter()
+        # A cancellation token makes the provider stream, which is what exposes time-to-first-token.
+        text = nlp.generate_concise_response(query, max_tokens=config.max_tokens, cancel_token=CancellationToken())
+        latency = time.perf_counter() - start
+        return SweepGeneration(text, nlp.last_time_to_first_token, latency)
+
+
+class CassetteBackend:
+    def __init__(self, path: str, record_from=None):
+        """
+        Replays generations recorded in a JSON cassette, so a sweep can be rerun
+        deterministically and offline.
+
+        Parameters:
+            path (str): Cassette file.
+            record_from: Backend used to fill in missing entries, which are then saved.
+                If None, a missing entry is an error.
+        """
+        self.path = path
+        self.record_from = record_from
+        self._entries = {}
+        if os.path.exists(path):
+            with open(path, 'r') as f:
+                self._entries = json.load(f)
+
+    def _key(self, query: str, config: SweepConfig) -> str:
+        return json.dumps([query, list(config)])
+
+    def generate(self, query: str, config: SweepConfig) -> SweepGeneration:
+        key = self._key(query, config)
+        entry = self._entries.get(key)
+        if entry is None:
+            if self.record_from is None:
+                raise KeyError(f"No recording for {config.label}: {query}")
+            generation = self.record_from.generate(query, config)
+            self._entries[key] = generation._asdict()
+            self.save()
+            return generation
+        return SweepGeneration(**entry)
+
+    def save(self):
+        with open(self.path, 'w') as f:
+            json.dump(self._entries, f, indent=1)
+
+
+def check_quality(text: str, expected_apis: Iterable[str]) -> Dict[str, float]:
+    """
+    Automatic quality checks for one raw model response. Only fenced code blocks
+    are parsed, so prose such as "set axis=1" does not count as code.
+
+    Returns:
+        dict: 'parses' (1.0 if there is code and every block is valid Python),
+        'safe' (1.0 if the response passes SafetyChecker), 'api_recall' (fraction
+        of expected APIs mentioned as whole words, so "mean" does not match
+        "meaning") and 'score', their mean.
+    """
+    generator = InstructionGenerator()
+    blocks = generator.extract_code_blocks(text)
+    # An answer without code has shown nothing that runs
+    parses = 1.0 if blocks else 0.0
+    for block in blocks:
+        try:
+            ast.parse(block)
+        except SyntaxError:
+            parses = 0.0
+            break
+    safe = 1.0 if SafetyChecker().check_content(text) else 0.0
+    expected_apis = list(expected_apis)
+    mentioned = [
+        api for api in expected_apis
+        if re.search(r"(?<!\w)" + re.escape(api) + r"(?!\w)", text, re.IGNORECASE)
+    ]
+    api_recall = len(mentioned) / len(expected_apis) if expected_apis else 1.0
+    return {
+        'parses': parses,
+        'safe': safe,
+        'api_recall': api_recall,
+        'score': (parses + safe + api_recall) / 3,
+    }
+
+
+def build_grid(
+    models: Iterable[str],
+    max_tokens: Iterable[int],
+    temperatures: Iterable[float],
+    presence_penalties: Iterable[float]
+) -> List[SweepConfig]:
+    return [SweepConfig(*values) for values in itertools.product(models, max_tokens, temperatures, presence_penalties)]
+
+
+def run_sweep(backend, grid: List[SweepConfig], corpus: List[Dict] = DEFAULT_CORPUS) -> List[Dict]:
+    """
+    Replays every query in `corpus` against every configuration in `grid`.
+
+    Returns:
+        List[dict]: One summary per configuration with mean time-to-first-token,
+        latency, completion tokens and quality scores over the corpus.
+    """
+    results = []
+    for config in grid:
+        rows = []
+        for item in corpus:
+            try:
+                generation = backend.generate(item['query'], config)
+            except Exception as e:
+                logger.error(f"{config.label} failed on {item['query']!r}: {e}")
+                continue
+            quality = check_quality(generation.text, item.get('expected_apis', []))
+            rows.append({
+                'ttft': generation.time_to_first_token,
+                'latency': generation.latency,
+                'tokens': estimate_tokens(generation.text),
+                **quality,
+            })
+        if not rows:
+            continue
+        ttfts = [row['ttft'] for row in rows if row['ttft'] is not None]
+        summary = {'config': config, 'runs': len(rows)}
+        summary['ttft'] = sum(ttfts) / len(ttfts) if ttfts else None
+        for metric in ('latency', 'tokens', 'parses', 'safe', 'api_recall', 'score'):
+            summary[metric] = sum(row[metric] for row in rows) / len(rows)
+        results.append(summary)
+    return results
+
+
+def pareto_front(results: List[Dict]) -> List[Dict]:
+    """
+    Returns the configurations not dominated on (lower latency, fewer tokens,
+    higher quality score).
+    """
+    def dominates(a, b):
+        no_worse = a['latency'] <= b['latency'] and a['tokens'] <= b['tokens'] and a['score'] >= b['score']
+        better = a['latency'] < b['latency'] or a['tokens'] < b['tokens'] or a['score'] > b['score']
+        return no_worse and better
+
+    return [result for result in results if not any(dominates(other, result) for other in results)]
+
+
+def format_report(results: List[Dict]) -> str:
+    """
+    Renders sweep results as a Markdown table, best quality first, with the
+    Pareto-optimal configurations marked.
+    """
+    front = {id(result) for result in pareto_front(results)}
+    lines = [
+        "| Pareto | Model | max_tokens | temperature | presence_penalty | TTFT (s) | Latency (s) | Tokens | Parses | Safe | API recall | Score |",
+        "|---|---|---|---|---|---|---|---|---|---|---|---|",
+    ]
+    for result in sorted(results, key=lambda r: (-r['score'], r['latency'])):
+        config = result['config']
+        ttft = f"{result['ttft']:.2f}" if result['ttft'] is not None else "n/a"
+        lines.append(
+            f"| {'*' if id(result) in front else ''} | {config.model} | {config.max_tokens} | {config.temperature:g} "
+            f"| {config.presence_penalty:g} | {ttft} | {result['latency']:.2f} | {result['tokens']:.0f} "
+            f"| {result['parses']:.2f} | {result['safe']:.2f} | {result['api_recall']:.2f} | {result['score']:.2f} |"
+        )
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Sweep models and generation parameters over a fixed query corpus and report latency/cost vs quality.'
+    )
+    parser.add_argument('--backend', choices=['live', 'cassette', 'mock'], default='live',
+                        help='live: call the provider; cassette: replay recordings; '
+                             'mock: synthetic responses for testing the harness itself')
+    parser.add_argument('--cassette', help='Cassette file to replay (and, with --record, to record into)')
+    parser.add_argument('--record', action='store_true', help='Record missing cassette entries from the live provider')
+    parser.add_argument('--config', default='config.json', help='DataWizzy configuration file for live runs')
+    parser.add_argument('--provider', default='openai', help='Model provider for live runs')
+    parser.add_argument('--corpus', help='JSON file with a list of {"query", "expected_apis"} items')
+    parser.add_argument('--models', nargs='+', default=['gpt-4o-mini'])
+    parser.add_argument('--max-tokens', nargs='+', type=int, default=[300, 600])
+    parser.add_argument('--temperatures', nargs='+', type=float, default=[0.2, 0.5])
+    parser.add_argument('--presence-penalties', nargs='+', type=float, default=[0.0, 0.6])
+    parser.add_argument('-o', '--output', help='Write the Markdown report to this file')
+    args = parser.parse_args()
+
+    corpus = DEFAULT_CORPUS
+    if args.corpus:
+        with open(args.corpus, 'r') as f:
+            corpus = json.load(f)
+
+    grid = build_grid(args.models, args.max_tokens, args.temperatures, args.presence_penalties)
+    live = None
+    if args.backend == 'live' or (args.backend == 'cassette' and args.record):
+        live = ProcessorBackend(config_path=args.config, provider=args.provider)
+        try:
+            live.check_grid(grid)
+        except ValueError as e:
+            parser.error(str(e))
+
+    if args.backend == 'mock':
+        backend = MockBackend(corpus)
+    elif args.backend == 'live':
+        backend = live
+    else:
+        if not args.cassette:
+            parser.error("--backend cassette requires --cassette")
+        backend = CassetteBackend(args.cassette, record_from=live)
+
+    report = format_report(run_sweep(backend, grid, corpus))
+    if args.backend == 'mock':
+        report = (
+            "Harness self-test: the mock backend's responses and timings are synthetic "
+            "and do not measure any model.\n\n" + report
+        )
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(report + "\n")
+    print(report)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,36 @@
+from typing import Dict, List
+
+# Rough characters-per-token ratio for English prose and Python code with
+# GPT-style BPE tokenizers. Good enough for budgeting; not for billing.
+CHARS_PER_TOKEN = 4
+
+# Per-message overhead the chat format adds around each message's content.
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Estimates the number of tokens in `text` without loading a tokenizer.
+
+    Parameters:
+        text (str): The text to measure.
+
+    Returns:
+        int: Approximate token count.
+    """
+    if not text:
+        return 0
+    return max(1, (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN)
+
+
+def estimate_message_tokens(messages: List[Dict[str, str]]) -> int:
+    """
+    Estimates the prompt size of a list of chat messages.
+
+    Parameters:
+        messages (List[dict]): Chat messages with 'role' and 'content' keys.
+
+    Returns:
+        int: Approximate token count for the whole prompt.
+    """
+    return sum(estimate_tokens(msg['content']) + MESSAGE_OVERHEAD_TOKENS for msg in messages)
@@ -0,0 +1,414 @@
+import contextlib
+import hashlib
+import importlib
+import io
+import json
+import logging
+import multiprocessing
+import os
+import queue
+import select
+import shutil
+import signal
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Dict, Iterable, NamedTuple, Optional
+
+from .instruction_generator import InstructionGenerator
+from .safety import SafetyChecker
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PRELOAD = ('numpy', 'pandas', 'matplotlib', 'matplotlib.pyplot', 'seaborn')
+MAX_OUTPUT_CHARS = 2000
+DEFAULT_SANDBOX_USER = 'nobody'
+# Extra seconds verify() waits beyond the snippet timeout for queueing and IPC
+RESULT_MARGIN = 10.0
+# Seconds to wait for workers to import their preloads
+STARTUP_TIMEOUT = 120.0
+
+CLONE_NEWUSER = getattr(os, 'CLONE_NEWUSER', 0x10000000)
+CLONE_NEWNET = getattr(os, 'CLONE_NEWNET', 0x40000000)
+
+
+class VerificationResult(NamedTuple):
+    ok: bool
+    error: Optional[str]
+    stdout: str
+    duration: float
+    cached: bool = False
+
+
+def _apply_limits(cpu_seconds: int, memory_mb: int):
+    if resource is None:
+        return
+    resource.setrlimit(resource.RLIMIT_CPU, (cpu_seconds, cpu_seconds))
+    memory = memory_mb * 1024 * 1024
+    resource.setrlimit(resource.RLIMIT_AS, (memory, memory))
+    # Keep snippets from filling the disk with saved figures or CSVs.
+    resource.setrlimit(resource.RLIMIT_FSIZE, (16 * 1024 * 1024, 16 * 1024 * 1024))
+
+
+def _unshare(flags: int):
+    if hasattr(os, 'unshare'):
+        os.unshare(flags)
+        return
+    import ctypes
+    libc = ctypes.CDLL(None, use_errno=True)
+    if libc.unshare(flags) != 0:
+        errno = ctypes.get_errno()
+        raise OSError(errno, os.strerror(errno))
+
+
+def _isolate(sandbox_user: Optional[str], isolate_network: bool):
+    """
+    Cuts the worker off from the network and drops root before any snippet runs.
+
+    Raises:
+        OSError: If the network namespace or user switch is not permitted.
+        RuntimeError: If the worker would otherwise run snippets as root.
+    """
+    if isolate_network:
+        # A new network namespace only has a loopback interface that is down.
+        # Without root, a user namespace grants the right to create it.
+        _unshare(CLONE_NEWNET if os.geteuid() == 0 else CLONE_NEWUSER | CLONE_NEWNET)
+    if os.geteuid() == 0:
+        if not sandbox_user:
+            raise RuntimeError("Refusing to run snippets as root; set sandbox_user.")
+        import pwd
+        entry = pwd.getpwnam(sandbox_user)
+        os.setgroups([])
+        os.setgid(entry.pw_gid)
+        os.setuid(entry.pw_uid)
+
+
+def _execute(code: str) -> Dict[str, object]:
+    stdout = io.StringIO()
+    try:
+        compiled = compile(code, '<snippet>', 'exec')
+        with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stdout):
+            exec(compiled, {'__name__': '__main__'})
+    except BaseException as e:
+        # Only the exception class leaves the sandbox; its message could carry file contents
+        return {'ok': False, 'error': type(e).__name__, 'stdout': stdout.getvalue()[:MAX_OUTPUT_CHARS]}
+    return {'ok': True, 'error': None, 'stdout': stdout.getvalue()[:MAX_OUTPUT_CHARS]}
+
+
+def _run_in_child(code: str, cpu_seconds: int, memory_mb: int, timeout: float) -> Dict[str, object]:
+    """
+    Forks the warmed worker and runs the snippet in the child, so every snippet
+    starts from the same preloaded state and gets its own resource limits.
+    """
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_fd)
+        try:
+            _apply_limits(cpu_seconds, memory_mb)
+            payload = json.dumps(_execute(code)).encode('utf-8')
+            with os.fdopen(write_fd, 'wb') as pipe:
+                pipe.write(payload)
+        finally:
+            os._exit(0)
+
+    os.close(write_fd)
+    chunks = []
+    deadline = time.monotonic() + timeout
+    timed_out = False
+    with os.fdopen(read_fd, 'rb') as pipe:
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                timed_out = True
+                break
+            ready, _, _ = select.select([pipe], [], [], remaining)
+            if not ready:
+                continue
+            chunk = os.read(pipe.fileno(), 65536)
+            if not chunk:
+                break
+            chunks.append(chunk)
+
+    if timed_out:
+        os.kill(pid, signal.SIGKILL)
+    _, status = os.waitpid(pid, 0)
+
+    if timed_out:
+        return {'ok': False, 'error': f"Timed out after {timeout:g}s", 'stdout': ''}
+    if not chunks:
+        if os.WIFSIGNALED(status):
+            signum = os.WTERMSIG(status)
+            if signum == signal.SIGXCPU:
+                return {'ok': False, 'error': f"CPU limit of {cpu_seconds}s exceeded", 'stdout': ''}
+            return {'ok': False, 'error': f"Killed by {signal.Signals(signum).name}", 'stdout': ''}
+        return {'ok': False, 'error': "Snippet exited without reporting a result", 'stdout': ''}
+    return json.loads(b"".join(chunks).decode('utf-8'))
+
+
+def _worker_main(
+    tasks,
+    results,
+    preload: Iterable[str],
+    cpu_seconds: int,
+    memory_mb: int,
+    timeout: float,
+    sandbox_user: Optional[str],
+    isolate_network: bool
+):
+    try:
+        _isolate(sandbox_user, isolate_network)
+    except Exception as e:
+        results.put(('error', os.getpid(), f"Sandbox isolation failed: {e}"))
+        return
+    workdir = tempfile.mkdtemp(prefix='datawizzy-sandbox-')
+    os.chdir(workdir)
+    # Headless backend so figures never try to open a window.
+    os.environ['MPLBACKEND'] = 'Agg'
+    os.environ['MPLCONFIGDIR'] = workdir
+    for module_name in preload:
+        try:
+            importlib.import_module(module_name)
+        except Exception:
+            # A broken optional library must not keep the worker from starting
+            pass
+    results.put(('ready', os.getpid()))
+    try:
+        while True:
+            task = tasks.get()
+            if task is None:
+                break
+            task_id, code = task
+            results.put(('started', os.getpid(), task_id))
+            try:
+                outcome = _run_in_child(code, cpu_seconds, memory_mb, timeout)
+            except Exception as e:
+                outcome = {'ok': False, 'error': f"Sandbox error: {type(e).__name__}", 'stdout': ''}
+            results.put(('done', os.getpid(), task_id, outcome))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+class SnippetVerifier:
+    def __init__(
+        self,
+        num_workers: int = 2,
+        timeout: float = 5.0,
+        cpu_seconds: int = 5,
+        memory_mb: int = 1024,
+        preload: Iterable[str] = DEFAULT_PRELOAD,
+        cache_size: int = 512,
+        sandbox_user: Optional[str] = DEFAULT_SANDBOX_USER,
+        isolate_network: bool = True
+    ):
+        """
+        Executes generated code snippets in a pool of pre-warmed sandbox workers.
+
+        Each worker imports the data science stack once at start-up and then forks a
+        fresh child per snippet, so a snippet pays neither interpreter start-up nor
+        library import time. Results are cached by snippet hash.
+
+        Workers run in their own network namespace and, when the server runs as
+        root, as `sandbox_user`; they refuse to start if either cannot be arranged.
+        Failures report only the exception class, never its message or traceback.
+
+        Parameters:
+            num_workers (int): Number of warm worker processes.
+            timeout (float): Wall-clock limit per snippet, in seconds.
+            cpu_seconds (int): CPU time limit per snippet, in seconds.
+            memory_mb (int): Address space limit per snippet, in megabytes.
+            preload (Iterable[str]): Modules imported by each worker before it is ready.
+            cache_size (int): Number of snippet results to keep.
+            sandbox_user (Optional[str]): Unprivileged account workers switch to
+                when started as root.
+            isolate_network (bool): Give workers no network access (Linux only).
+
+        Raises:
+            RuntimeError: If the workers cannot be started in the sandbox.
+        """
+        if not hasattr(os, 'fork'):
+            raise RuntimeError("Snippet verification requires a platform that supports fork().")
+        if num_workers < 1:
+            raise ValueError("num_workers must be at least 1.")
+
+        self.timeout = timeout
+        self.cache_size = cache_size
+        self._worker_args = (tuple(preload), cpu_seconds, memory_mb, timeout, sandbox_user, isolate_network)
+        self.safety = SafetyChecker()
+        self.generator = InstructionGenerator()
+
+        self._cache: "OrderedDict[str, VerificationResult]" = OrderedDict()
+        self._pending: Dict[int, Future] = {}
+        # Worker pid -> id of the task it is running
+        self._running: Dict[int, int] = {}
+        self._lock = threading.Lock()
+        self._next_id = 0
+        self._closing = False
+
+        methods = multiprocessing.get_all_start_methods()
+        self._context = multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+        self._tasks = self._context.Queue()
+        self._results = self._context.Queue()
+        self._workers = [self._start_worker() for _ in range(num_workers)]
+        try:
+            self._wait_until_ready()
+        except BaseException:
+            self._terminate_workers()
+            raise
+
+        self._collector = threading.Thread(target=self._collect_results, name="datawizzy-verifier", daemon=True)
+        self._collector.start()
+        logger.info(f"Snippet verifier started with {num_workers} warm workers.")
+
+    def _start_worker(self):
+        worker = self._context.Process(
+            target=_worker_main, args=(self._tasks, self._results) + self._worker_args, daemon=True
+        )
+        worker.start()
+        return worker
+
+    def _wait_until_ready(self):
+        # Workers report in once isolated and their preloads are imported.
+        deadline = time.monotonic() + STARTUP_TIMEOUT
+        ready = 0
+        while ready < len(self._workers):
+            try:
+                message = self._results.get(timeout=1)
+            except queue.Empty:
+                if not all(worker.is_alive() for worker in self._workers):
+                    raise RuntimeError("A sandbox worker exited during start-up.")
+                if time.monotonic() > deadline:
+                    raise RuntimeError("Sandbox workers did not start in time.")
+                continue
+            if message[0] == 'error':
+                raise RuntimeError(message[2])
+            ready += 1
+
+    def _terminate_workers(self):
+        for worker in self._workers:
+            if worker.is_alive():
+                worker.terminate()
+
+    def _resolve(self, task_id: int, outcome: Dict[str, object]):
+        with self._lock:
+            future = self._pending.pop(task_id, None)
+        if future is not None:
+            future.set_result(outcome)
+
+    def _replace_dead_workers(self):
+        for index, worker in enumerate(self._workers):
+            if worker.is_alive() or self._closing:
+                continue
+            task_id = self._running.pop(worker.pid, None)
+            logger.warning(f"Sandbox worker {worker.pid} died (exit code {worker.exitcode}); restarting it.")
+            if task_id is not None:
+                self._resolve(task_id, {'ok': False, 'error': "Sandbox worker died", 'stdout': ''})
+            self._workers[index] = self._start_worker()
+
+    def _collect_results(self):
+        while True:
+            try:
+                message = self._results.get(timeout=1)
+            except queue.Empty:
+                self._replace_dead_workers()
+                continue
+            if message is None:
+                break
+            kind = message[0]
+            if kind == 'started':
+                self._running[message[1]] = message[2]
+            elif kind == 'done':
+                _, pid, task_id, outcome = message
+                self._running.pop(pid, None)
+                self._resolve(task_id, outcome)
+            elif kind == 'error':
+                logger.error(message[2])
+
+    def _cache_key(self, code: str) -> str:
+        return hashlib.sha256(code.encode('utf-8')).hexdigest()
+
+    def submit(self, code: str) -> Future:
+        """
+        Queues a snippet for execution.
+
+        Returns:
+            Future: Resolves to a VerificationResult.
+        """
+        key = self._cache_key(code)
+        result = Future()
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+                result.set_result(cached._replace(cached=True))
+                return result
+
+        if not self.safety.check_code(code):
+            result.set_result(VerificationResult(False, "Rejected by safety check", "", 0.0))
+            return result
+
+        raw = Future()
+        started = time.perf_counter()
+        with self._lock:
+            task_id = self._next_id
+            self._next_id += 1
+            self._pending[task_id] = raw
+
+        def _done(raw_future):
+            outcome = raw_future.result()
+            verification = VerificationResult(
+                outcome['ok'], outcome['error'], outcome['stdout'], time.perf_counter() - started
+            )
+            with self._lock:
+                self._cache[key] = verification
+                if len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+            result.set_result(verification)
+
+        raw.add_done_callback(_done)
+        self._tasks.put((task_id, code))
+        return result
+
+    def verify(self, code: str) -> VerificationResult:
+        """
+        Runs a snippet in the sandbox and waits for the outcome.
+
+        Raises:
+            TimeoutError: If no result arrives within the snippet timeout plus a margin.
+        """
+        return self.submit(code).result(timeout=self.timeout + RESULT_MARGIN)
+
+    def verify_instructions(self, text: str) -> Optional[VerificationResult]:
+        """
+        Verifies the fenced Python code in a model response.
+
+        Pass the raw response rather than format_instructions output, which wraps
+        any prose line containing '=' in a code fence. The blocks of one answer
+        build on each other (imports, then a DataFrame, then a plot), so they are
+        run together as a single program.
+
+        Returns:
+            Optional[VerificationResult]: The outcome, or None if the text has no code.
+        """
+        blocks = self.generator.extract_code_blocks(text)
+        if not blocks:
+            return None
+        return self.verify("\n".join(blocks))
+
+    def close(self):
+        self._closing = True
+        for _ in self._workers:
+            self._tasks.put(None)
+        for worker in self._workers:
+            worker.join(timeout=self.timeout)
+            if worker.is_alive():
+                worker.terminate()
+        self._results.put(None)
+        self._collector.join(timeout=1)
@@ -0,0 +1,52 @@
+import time
+import unittest
+from datawizzy.cancellation import CancellationMetrics, CancellationToken, GenerationCancelled
+
+
+class TestCancellationToken(unittest.TestCase):
+    def test_cancel_runs_callbacks_once(self):
+        token = CancellationToken()
+        calls = []
+        token.add_callback(lambda: calls.append('a'))
+        removed = token.add_callback(lambda: calls.append('b'))
+        token.remove_callback(removed)
+        token.cancel("superseded")
+        token.cancel("again")
+        self.assertTrue(token.cancelled)
+        self.assertEqual(token.reason, "superseded")
+        self.assertEqual(calls, ['a'])
+
+    def test_callback_added_after_cancel_runs_immediately(self):
+        token = CancellationToken()
+        token.cancel()
+        calls = []
+        self.assertIsNone(token.add_callback(lambda: calls.append(1)))
+        self.assertEqual(calls, [1])
+
+    def test_deadline(self):
+        token = CancellationToken(timeout=0.02)
+        self.assertFalse(token.cancelled)
+        self.assertGreater(token.remaining(), 0)
+        time.sleep(0.03)
+        with self.assertRaises(GenerationCancelled) as context:
+            token.raise_if_cancelled(tokens_generated=5)
+        self.assertEqual(context.exception.reason, "deadline exceeded")
+        self.assertEqual(context.exception.tokens_generated, 5)
+        self.assertEqual(token.remaining(), 0.0)
+
+    def test_no_deadline(self):
+        token = CancellationToken()
+        self.assertIsNone(token.remaining())
+        token.raise_if_cancelled()
+
+
+class TestCancellationMetrics(unittest.TestCase):
+    def test_record(self):
+        metrics = CancellationMetrics()
+        metrics.record(120)
+        metrics.record(-3)
+        self.assertEqual(metrics.snapshot(), {'cancelled': 2, 'tokens_saved': 120})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+import json
+import os
+import tempfile
+import unittest
+from datawizzy.doc_index import DocIndex, _signature, build_index, format_reference_context, tokenize
+
+
+class TestDocIndex(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tmpdir = tempfile.TemporaryDirectory()
+        cls.count = build_index(cls.tmpdir.name, modules=['textwrap', 'json', 'not_a_real_module'])
+        cls.index = DocIndex(cls.tmpdir.name)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.index.close()
+        cls.tmpdir.cleanup()
+
+    def test_tokenize_splits_identifiers(self):
+        self.assertEqual(tokenize("How do I read_csv?"), ["read_csv", "read", "csv"])
+
+    def test_missing_modules_are_skipped(self):
+        self.assertGreater(self.count, 0)
+        self.assertEqual(self.index.modules, ['textwrap', 'json', 'not_a_real_module'])
+
+    def test_search_ranks_matching_api_first(self):
+        results = self.index.search("remove common leading whitespace with dedent", k=2)
+        self.assertEqual(len(results), 2)
+        self.assertTrue(results[0].startswith("textwrap.dedent(text)"))
+
+    def test_search_without_matches(self):
+        self.assertEqual(self.index.search("zzzz qqqq"), [])
+
+    def test_every_term_is_found(self):
+        terms = [self.index._term(i).decode('utf-8') for i in range(self.index.num_terms)]
+        self.assertEqual(terms, sorted(terms))
+        with open(os.path.join(self.tmpdir.name, 'meta.json')) as f:
+            # The vocabulary lives in the mapped files, not in the parsed metadata
+            self.assertNotIn('terms', json.load(f))
+        for term in terms:
+            _, count = self.index._postings(term)
+            self.assertGreater(count, 0)
+        self.assertIsNone(self.index._postings("aaaa"))
+        self.assertIsNone(self.index._postings("zzzz"))
+
+    def test_signature_drops_self(self):
+        class Frame:
+            def mean(self, /, axis=None):
+                pass
+
+            def copy(self):
+                pass
+
+        self.assertEqual(_signature(Frame.mean), "(axis=None)")
+        self.assertEqual(_signature(Frame.copy), "()")
+
+    def test_missing_index(self):
+        with tempfile.TemporaryDirectory() as empty:
+            with self.assertRaises(FileNotFoundError):
+                DocIndex(empty)
+
+    def test_reference_context_respects_budget(self):
+        snippets = ["a" * 400, "json.dumps(obj) - Serialize obj.", "b" * 40]
+        context = format_reference_context(snippets, token_budget=40)
+        self.assertIn("json.dumps", context)
+        self.assertNotIn("a" * 400, context)
+        self.assertEqual(format_reference_context(snippets, token_budget=5), "")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+import unittest
+from datawizzy.instruction_generator import InstructionGenerator
+
+
+class TestInstructionGenerator(unittest.TestCase):
+    def setUp(self):
+        self.generator = InstructionGenerator()
+
+    def test_format_leaves_fenced_code_alone(self):
+        text = "Set it up:\n```python\nx = 1\n```\ny = 2"
+        self.assertEqual(
+            self.generator.format_instructions(text),
+            "Set it up:\n```python\nx = 1\n```\n```python\ny = 2\n```"
+        )
+
+    def test_split_steps(self):
+        text = (
+            "To plot data:\n\n"
+            "1. Load it:\n```python\nimport pandas as pd\n\n2. not a step\n```\n"
+            "2. Plot with `df.plot()`.\n"
+            "**Step 3:** Show it."
+        )
+        intro, steps = self.generator.split_steps(text)
+        self.assertEqual(intro, "To plot data:")
+        self.assertEqual(len(steps), 3)
+        self.assertIn("2. not a step", steps[0])
+        self.assertEqual(steps[2], "**Step 3:** Show it.")
+
+    def test_split_steps_falls_back_to_paragraphs(self):
+        intro, steps = self.generator.split_steps("First idea.\n\nSecond idea.")
+        self.assertEqual(intro, "")
+        self.assertEqual(steps, ["First idea.", "Second idea."])
+
+    def test_merge_expansion(self):
+        expansion = (
+            "### Step 2\nPass `kind='bar'` for bar charts.\n"
+            "### Step 5\nOrphan addition.\n"
+            "### Additional steps\n3. Save the figure with `savefig`."
+        )
+        merged = self.generator.merge_expansion("Intro.", ["1. Load.", "2. Plot."], expansion)
+        self.assertEqual(
+            merged,
+            "Intro.\n\n1. Load.\n\n2. Plot.\n\nPass `kind='bar'` for bar charts.\n\n"
+            "Orphan addition.\n\n3. Save the figure with `savefig`."
+        )
+
+    def test_parse_expansion_titled_headings(self):
+        expansion = (
+            "### Step 1: Load the data\nUse `pd.read_csv`.\n"
+            "### Step 2 - Plot\nPass `kind='bar'`.\n"
+            "**Step 3:**\nSave it."
+        )
+        deltas, extra = self.generator.parse_expansion(expansion)
+        self.assertEqual(deltas, {1: "Use `pd.read_csv`.", 2: "Pass `kind='bar'`.", 3: "Save it."})
+        self.assertEqual(extra, "")
+
+    def test_split_steps_with_inline_code(self):
+        # The raw answer keeps one step per numbered line even when a step contains '='
+        text = "1. Load the data.\n2. Call df = df.dropna() to drop rows.\n3. Check the result."
+        intro, steps = self.generator.split_steps(text)
+        self.assertEqual(intro, "")
+        self.assertEqual(steps, ["1. Load the data.", "2. Call df = df.dropna() to drop rows.", "3. Check the result."])
+
+    def test_extract_code_blocks(self):
+        text = "```python\na = 1\n```\ntext\n```bash\nls\n```\n```\nb = 2\n```"
+        self.assertEqual(self.generator.extract_code_blocks(text), ["a = 1", "b = 2"])
+
+    def test_formatted_blocks_stay_whole(self):
+        code = "import pandas as pd\ndf = pd.DataFrame({'a': [1, 2]})\nprint(df)"
+        formatted = self.generator.format_instructions(f"Try this:\n```python\n{code}\n```")
+        self.assertEqual(self.generator.extract_code_blocks(formatted), [code])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,193 @@
+import threading
+import unittest
+from datawizzy.cancellation import GenerationCancelled
+from datawizzy.local_backend import LocalInferenceBackend
+
+try:
+    import torch
+    from tokenizers import Tokenizer, models, pre_tokenizers
+    from transformers import LlamaConfig, LlamaForCausalLM, PreTrainedTokenizerFast
+except ImportError:
+    torch = None
+
+
+class FakeLocalBackend(LocalInferenceBackend):
+    """Replaces the transformers model with one that echoes a fixed number of words."""
+
+    def _load_model(self):
+        self._tokenizer = None
+        self.release = threading.Event()
+        self.release.set()
+
+    def _build_prompt(self, messages):
+        return messages[-1]['content']
+
+    def _run_batch(self, batch):
+        self.release.wait()
+        for generation in batch:
+            for i in range(generation.max_tokens):
+                if generation.cancelled:
+                    break
+                generation._emit(f"{generation.prompt}-{i} ")
+
+
+class TestLocalInferenceBackend(unittest.TestCase):
+    def setUp(self):
+        self.backend = FakeLocalBackend(max_batch_size=4, max_wait_ms=200)
+
+    def tearDown(self):
+        self.backend.shutdown(timeout=1)
+
+    def test_generate_returns_full_text(self):
+        response = self.backend.generate([{"role": "user", "content": "q"}], max_tokens=3)
+        self.assertEqual(response, "q-0 q-1 q-2")
+
+    def test_stream_yields_pieces(self):
+        pieces = list(self.backend.generate_stream([{"role": "user", "content": "s"}], max_tokens=2))
+        self.assertEqual(pieces, ["s-0 ", "s-1 "])
+
+    def test_concurrent_requests_share_a_batch(self):
+        generations = [
+            self.backend.submit([{"role": "user", "content": str(i)}], max_tokens=1) for i in range(4)
+        ]
+        for i, generation in enumerate(generations):
+            self.assertEqual(generation.result(timeout=2), f"{i}-0")
+            self.assertEqual(generation.num_tokens, 1)
+        self.assertEqual(self.backend.batch_sizes, [4])
+
+    def test_batch_size_is_capped(self):
+        self.backend.release.clear()
+        generations = [
+            self.backend.submit([{"role": "user", "content": str(i)}], max_tokens=1) for i in range(6)
+        ]
+        self.backend.release.set()
+        for generation in generations:
+            generation.result(timeout=2)
+        self.assertEqual(sum(self.backend.batch_sizes), 6)
+        self.assertLessEqual(max(self.backend.batch_sizes), 4)
+
+    def test_errors_are_raised_to_callers(self):
+        def fail(batch):
+            raise RuntimeError("boom")
+        self.backend._run_batch = fail
+        with self.assertRaises(RuntimeError):
+            self.backend.generate([{"role": "user", "content": "q"}], max_tokens=1)
+
+    def test_cancel_queued_request(self):
+        self.backend.release.clear()
+        running = self.backend.submit([{"role": "user", "content": "a"}], max_tokens=1)
+        cancelled = self.backend.submit([{"role": "user", "content": "b"}], max_tokens=1)
+        cancelled.cancel("superseded")
+        with self.assertRaises(GenerationCancelled):
+            cancelled.result(timeout=1)
+        self.backend.release.set()
+        self.assertEqual(running.result(timeout=2), "a-0")
+
+    def test_submit_after_shutdown(self):
+        self.backend.shutdown(timeout=1)
+        with self.assertRaises(RuntimeError):
+            self.backend.submit([{"role": "user", "content": "q"}])
+
+
+class TinyModelBackend(LocalInferenceBackend):
+    """Runs the real batched decode on a tiny, randomly initialised Llama model."""
+
+    WORDS = "user: assistant: load the data plot a histogram of column mean drop rows with missing values group by".split()
+
+    def _load_model(self):
+        vocab = {word: i for i, word in enumerate(["[UNK]", "[PAD]", "[EOS]"] + self.WORDS)}
+        tokenizer = Tokenizer(models.WordLevel(vocab, unk_token="[UNK]"))
+        tokenizer.pre_tokenizer = pre_tokenizers.WhitespaceSplit()
+        self._torch = torch
+        self._tokenizer = PreTrainedTokenizerFast(
+            tokenizer_object=tokenizer, unk_token="[UNK]", pad_token="[PAD]", eos_token="[EOS]", padding_side="left"
+        )
+        torch.manual_seed(0)
+        config = LlamaConfig(
+            vocab_size=len(vocab), hidden_size=32, intermediate_size=64, num_hidden_layers=2,
+            num_attention_heads=4, num_key_value_heads=2, max_position_embeddings=128,
+            # Larger weights than the default make outputs sensitive to positions and padding
+            initializer_range=0.5
+        )
+        # Double precision keeps padded and unpadded runs from differing on near-tied logits
+        self._model = LlamaForCausalLM(config).double()
+        self._model.eval()
+
+
+@unittest.skipUnless(torch is not None, "torch and transformers are required")
+class TestLocalBatchedDecoding(unittest.TestCase):
+    PROMPTS = [
+        ("load the data", 6),
+        ("plot a histogram of column mean", 9),
+        ("drop rows", 4),
+    ]
+
+    def setUp(self):
+        self.backend = TinyModelBackend(max_batch_size=4, max_wait_ms=200)
+
+    def tearDown(self):
+        self.backend.shutdown(timeout=5)
+
+    def _run(self, prompts):
+        generations = [
+            self.backend.submit([{"role": "user", "content": prompt}], max_tokens=max_tokens, temperature=0)
+            for prompt, max_tokens in prompts
+        ]
+        return [(generation.result(timeout=30), generation.num_tokens) for generation in generations]
+
+    def _reference(self, prompt, max_tokens):
+        # Unbatched greedy decoding by transformers itself
+        tokenizer = self.backend._tokenizer
+        input_ids = tokenizer(self.backend._build_prompt([{"role": "user", "content": prompt}]), return_tensors="pt")["input_ids"]
+        output = self.backend._model.generate(
+            input_ids, max_new_tokens=max_tokens, do_sample=False,
+            eos_token_id=tokenizer.eos_token_id, pad_token_id=tokenizer.pad_token_id
+        )[0, input_ids.shape[1]:].tolist()
+        if tokenizer.eos_token_id in output:
+            output = output[:output.index(tokenizer.eos_token_id)]
+        return tokenizer.decode(output, skip_special_tokens=True).strip(), len(output)
+
+    def test_batched_greedy_matches_unbatched(self):
+        # Prompts of different lengths exercise left padding; different max_tokens leave
+        # finished rows decoding padding while the others carry on.
+        unbatched = [self._reference(*prompt) for prompt in self.PROMPTS]
+        self.assertEqual([self._run([prompt])[0] for prompt in self.PROMPTS], unbatched)
+        batched = self._run(self.PROMPTS)
+        self.assertEqual(self.backend.batch_sizes[-1], len(self.PROMPTS))
+        self.assertEqual(batched, unbatched)
+        self.assertEqual([tokens for _, tokens in batched], [max_tokens for _, max_tokens in self.PROMPTS])
+
+    def test_row_stops_at_eos(self):
+        text, _ = self._run([self.PROMPTS[1]])[0]
+        # Make the third greedy token of the second prompt the end-of-sequence token
+        self.backend._tokenizer.eos_token_id = self.backend._tokenizer.convert_tokens_to_ids(text.split()[2])
+        expected = [self._reference(*prompt) for prompt in self.PROMPTS]
+        batched = self._run(self.PROMPTS)
+        self.assertEqual(batched, expected)
+        self.assertEqual(batched[1][1], 2)
+
+    def test_late_request_joins_running_batch(self):
+        expected = [self._reference(*prompt) for prompt in self.PROMPTS[:2]]
+        first = self.backend.submit(
+            [{"role": "user", "content": self.PROMPTS[1][0]}], max_tokens=self.PROMPTS[1][1], temperature=0
+        )
+        late = []
+        emit = first._emit
+
+        def emit_and_submit(text):
+            # Runs on the scheduler thread, so the second request arrives mid-decode
+            emit(text)
+            if not late:
+                late.append(self.backend.submit(
+                    [{"role": "user", "content": self.PROMPTS[0][0]}], max_tokens=self.PROMPTS[0][1], temperature=0
+                ))
+
+        first._emit = emit_and_submit
+        self.assertEqual((first.result(timeout=30), first.num_tokens), expected[1])
+        self.assertEqual((late[0].result(timeout=30), late[0].num_tokens), expected[0])
+        self.assertEqual(self.backend.batch_sizes, [1])
+        self.assertEqual(self.backend.joined_requests, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,14 @@
+import json
+import os
+import tempfile
+import threading
 import unittest
+import openai
 from unittest.mock import patch, MagicMock
+from datawizzy.cancellation import CancellationToken, GenerationCancelled, cancellation_metrics
+from datawizzy.local_backend import LocalGeneration
 from datawizzy.nlp_processor import NLPProcessor
+from datawizzy.tokens import estimate_message_tokens
 
 class TestNLPProcessor(unittest.TestCase):
     @patch('your_module.openai.ChatCompletion.create')
@@ -67,5 +75,123 @@ class TestNLPProcessor(unittest.TestCase):
             )
         self.assertIn("Message 'content' must be a string.", str(context.exception))
 
+class CancellingStream:
+    """Provider stream that cancels `token` once `cancel_after` chunks have been read."""
+
+    def __init__(self, chunks, token=None, cancel_after=None):
+        self.chunks = chunks
+        self.token = token
+        self.cancel_after = cancel_after
+        self.closed = False
+
+    def __iter__(self):
+        for i, chunk in enumerate(self.chunks):
+            if i == self.cancel_after:
+                self.token.cancel("superseded")
+            yield chunk
+
+    def close(self):
+        self.closed = True
+
+
+class TestGenerationCancellation(unittest.TestCase):
+    MESSAGES = [{"role": "user", "content": "How do I drop missing values?"}]
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.config_path = os.path.join(self.tmpdir.name, 'config.json')
+        with open(self.config_path, 'w') as f:
+            json.dump({
+                'OPENAI_API_KEY': 'test-key',
+                'DOC_INDEX_PATH': os.path.join(self.tmpdir.name, 'no_index'),
+            }, f)
+        self.metrics_before = cancellation_metrics.snapshot()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def tokens_saved(self):
+        return cancellation_metrics.snapshot()['tokens_saved'] - self.metrics_before['tokens_saved']
+
+    def openai_chunks(self, pieces):
+        return [{'choices': [{'delta': {'content': piece}}]} for piece in pieces]
+
+    @patch('datawizzy.nlp_processor.openai.ChatCompletion.create')
+    def test_openai_stream_returns_text(self, mock_create):
+        mock_create.return_value = CancellingStream(self.openai_chunks(["Use ", "dropna()."]))
+        processor = NLPProcessor(config_path=self.config_path)
+        response = processor._generate_response(self.MESSAGES, max_tokens=50, cancel_token=CancellationToken())
+        self.assertEqual(response, "Use dropna().")
+        self.assertTrue(mock_create.call_args.kwargs['stream'])
+        self.assertIsNotNone(processor.last_time_to_first_token)
+
+    @patch('datawizzy.nlp_processor.openai.ChatCompletion.create')
+    def test_openai_cancelled_mid_stream(self, mock_create):
+        token = CancellationToken()
+        stream = CancellingStream(self.openai_chunks(["a", "b", "c", "d"]), token, cancel_after=2)
+        mock_create.return_value = stream
+        processor = NLPProcessor(config_path=self.config_path)
+        with self.assertRaises(GenerationCancelled) as context:
+            processor._generate_response(self.MESSAGES, max_tokens=50, cancel_token=token)
+        self.assertEqual(context.exception.tokens_generated, 2)
+        self.assertTrue(stream.closed)
+        self.assertEqual(self.tokens_saved(), 48)
+
+    @patch('datawizzy.nlp_processor.openai.ChatCompletion.create')
+    def test_cancelled_before_sending_saves_whole_call(self, mock_create):
+        token = CancellationToken()
+        token.cancel()
+        processor = NLPProcessor(config_path=self.config_path)
+        with self.assertRaises(GenerationCancelled):
+            processor._generate_response(self.MESSAGES, max_tokens=50, cancel_token=token)
+        mock_create.assert_not_called()
+        self.assertEqual(self.tokens_saved(), estimate_message_tokens(self.MESSAGES) + 50)
+
+    @patch('datawizzy.nlp_processor.openai.ChatCompletion.create')
+    def test_openai_request_timeout_counts_as_cancelled(self, mock_create):
+        mock_create.side_effect = openai.error.Timeout("Request timed out")
+        processor = NLPProcessor(config_path=self.config_path)
+        with self.assertRaises(GenerationCancelled) as context:
+            processor._generate_response(self.MESSAGES, max_tokens=50, cancel_token=CancellationToken(timeout=5))
+        self.assertEqual(context.exception.reason, "deadline exceeded")
+        self.assertEqual(self.tokens_saved(), 50)
+
+    @patch('datawizzy.nlp_processor.ollama')
+    def test_ollama_cancelled_mid_stream(self, mock_ollama):
+        token = CancellationToken()
+        stream = CancellingStream([{'response': piece} for piece in "abcd"], token, cancel_after=3)
+        mock_ollama.generate.return_value = stream
+        processor = NLPProcessor(config_path=self.config_path, model_provider='ollama')
+        with self.assertRaises(GenerationCancelled) as context:
+            processor._generate_response(self.MESSAGES, max_tokens=50, cancel_token=token)
+        self.assertTrue(mock_ollama.generate.call_args.kwargs['stream'])
+        self.assertEqual(context.exception.tokens_generated, 3)
+        self.assertTrue(stream.closed)
+        self.assertEqual(self.tokens_saved(), 47)
+
+    @patch('datawizzy.nlp_processor.get_local_backend')
+    def test_local_cancel_reaches_generation(self, mock_get_backend):
+        generation = LocalGeneration(self.MESSAGES, max_tokens=50, temperature=0.5)
+        generation._emit("partial")
+        mock_get_backend.return_value.submit.return_value = generation
+        processor = NLPProcessor(config_path=self.config_path, model_provider='local')
+        token = CancellationToken()
+        threading.Timer(0.1, token.cancel, args=("superseded",)).start()
+        with self.assertRaises(GenerationCancelled):
+            processor._generate_response(self.MESSAGES, max_tokens=50, cancel_token=token)
+        self.assertTrue(generation.cancelled)
+        self.assertEqual(self.tokens_saved(), 49)
+
+    @patch('datawizzy.nlp_processor.get_local_backend')
+    def test_local_deadline_cancels_generation(self, mock_get_backend):
+        generation = LocalGeneration(self.MESSAGES, max_tokens=50, temperature=0.5)
+        mock_get_backend.return_value.submit.return_value = generation
+        processor = NLPProcessor(config_path=self.config_path, model_provider='local')
+        with self.assertRaises(GenerationCancelled) as context:
+            processor._generate_response(self.MESSAGES, max_tokens=50, cancel_token=CancellationToken(timeout=0.1))
+        self.assertEqual(context.exception.reason, "deadline exceeded")
+        self.assertTrue(generation.cancelled)
+
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
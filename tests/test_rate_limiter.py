@@ -0,0 +1,95 @@
+import threading
+import time
+import unittest
+from datawizzy.cancellation import CancellationToken, GenerationCancelled
+from datawizzy.rate_limiter import (
+    PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE, RateLimitScheduler, TokenBucket
+)
+
+
+class TestTokenBucket(unittest.TestCase):
+    def test_starts_full_and_refills(self):
+        bucket = TokenBucket(rate_per_minute=60, burst_seconds=2)
+        now = bucket.updated
+        self.assertEqual(bucket.time_until(2, now), 0.0)
+        bucket.consume(2, now)
+        self.assertAlmostEqual(bucket.time_until(1, now), 1.0)
+        self.assertEqual(bucket.time_until(1, now + 1.0), 0.0)
+
+    def test_oversized_requests_wait_for_a_full_bucket(self):
+        bucket = TokenBucket(rate_per_minute=60, burst_seconds=1)
+        self.assertEqual(bucket.time_until(100, bucket.updated), 0.0)
+
+
+class TestRateLimitScheduler(unittest.TestCase):
+    def _start(self, scheduler, order, name, priority, user):
+        def run():
+            scheduler.acquire(10, priority=priority, user=user)
+            order.append(name)
+        thread = threading.Thread(target=run)
+        thread.start()
+        # Give the thread time to enqueue so arrival order is deterministic.
+        time.sleep(0.02)
+        return thread
+
+    def test_priority_classes_are_served_first(self):
+        # 600 RPM with a one-request burst: one admission every 0.1s
+        scheduler = RateLimitScheduler(600, 1000000, burst_seconds=0.1)
+        scheduler.acquire(10)
+        order = []
+        threads = [
+            self._start(scheduler, order, 'background', PRIORITY_BACKGROUND, 'batch'),
+            self._start(scheduler, order, 'interactive', PRIORITY_INTERACTIVE, 'alice'),
+        ]
+        self.assertEqual(scheduler.stats()['background']['queue_depth'], 1)
+        for thread in threads:
+            thread.join(timeout=2)
+        self.assertEqual(order, ['interactive', 'background'])
+
+    def test_users_are_served_round_robin(self):
+        scheduler = RateLimitScheduler(600, 1000000, burst_seconds=0.1)
+        scheduler.acquire(10)
+        order = []
+        threads = [
+            self._start(scheduler, order, 'a1', PRIORITY_INTERACTIVE, 'a'),
+            self._start(scheduler, order, 'a2', PRIORITY_INTERACTIVE, 'a'),
+            self._start(scheduler, order, 'b1', PRIORITY_INTERACTIVE, 'b'),
+        ]
+        for thread in threads:
+            thread.join(timeout=2)
+        self.assertEqual(order, ['a1', 'b1', 'a2'])
+
+    def test_token_budget_limits_admission(self):
+        scheduler = RateLimitScheduler(1000000, 6000, burst_seconds=1)
+        self.assertLess(scheduler.acquire(100), 0.05)
+        with self.assertRaises(TimeoutError):
+            scheduler.acquire(100, timeout=0.05)
+        self.assertEqual(scheduler.stats()['interactive']['queue_depth'], 0)
+
+    def test_cancellation_abandons_the_wait(self):
+        scheduler = RateLimitScheduler(1000000, 6000, burst_seconds=1)
+        scheduler.acquire(100)
+        token = CancellationToken()
+        threading.Timer(0.05, token.cancel).start()
+        started = time.monotonic()
+        with self.assertRaises(GenerationCancelled):
+            scheduler.acquire(100, cancel_token=token)
+        self.assertLess(time.monotonic() - started, 0.5)
+        self.assertEqual(scheduler.stats()['interactive']['queue_depth'], 0)
+
+    def test_stats(self):
+        scheduler = RateLimitScheduler(600, 1000000, burst_seconds=0.1)
+        scheduler.acquire(10)
+        scheduler.acquire(10)
+        stats = scheduler.stats()['interactive']
+        self.assertEqual(stats['admitted'], 2)
+        self.assertGreater(stats['max_wait'], 0.05)
+
+    def test_unknown_priority(self):
+        scheduler = RateLimitScheduler(60, 1000)
+        with self.assertRaises(ValueError):
+            scheduler.acquire(10, priority=7)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,140 @@
+import gc
+import os
+import resource
+import tempfile
+import time
+import tracemalloc
+import unittest
+from datawizzy.session_manager import SessionManager, message_bytes
+
+
+def resident_memory():
+    # Current RSS in bytes; getrusage only reports the peak, so prefer /proc where available
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * resource.getpagesize()
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestSessionManager(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.clock = FakeClock()
+        self.manager = SessionManager(
+            self.tmpdir.name, max_session_bytes=4 * message_bytes({'role': 'assistant', 'content': 'x' * 100}),
+            idle_timeout=60, eviction_interval=10, clock=self.clock
+        )
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def _message(self, i):
+        return {'role': 'user' if i % 2 == 0 else 'assistant', 'content': f"{i:03d}" + 'x' * 97}
+
+    def test_old_turns_are_offloaded_but_kept_on_disk(self):
+        session = self.manager.get("alice")
+        for i in range(10):
+            session.append(self._message(i))
+        self.assertEqual(len(session.messages), 4)
+        self.assertEqual(session.offloaded_count, 6)
+        self.assertLessEqual(session.memory_bytes, session.max_bytes)
+        self.assertEqual(session.messages[0], self._message(6))
+        self.assertEqual(session.all_messages(), [self._message(i) for i in range(10)])
+
+    def test_detailed_requested_uses_absolute_indices(self):
+        session = self.manager.get("alice")
+        for i in range(4):
+            session.append(self._message(i))
+        session.detailed_requested[1] = True
+        session.detailed_requested[3] = True
+        session.append(self._message(4))
+        session.append(self._message(5))
+        self.assertEqual(session.detailed_requested, {3: True})
+
+    def test_idle_sessions_are_evicted_and_restored(self):
+        session = self.manager.get("alice")
+        for i in range(6):
+            session.append(self._message(i))
+        self.clock.now = 30
+        self.manager.get("bob")
+        self.clock.now = 80
+        self.assertEqual(self.manager.evict_idle(), ["alice"])
+        self.assertEqual(len(self.manager), 1)
+
+        restored = self.manager.get("alice")
+        self.assertIsNot(restored, session)
+        self.assertEqual(list(restored.messages), [self._message(i) for i in range(2, 6)])
+        self.assertEqual(restored.offloaded_count, 2)
+
+    def test_eviction_runs_on_access(self):
+        self.manager.get("alice")
+        self.clock.now = 120
+        self.manager.get("bob")
+        self.assertEqual(set(self.manager.memory_report()), {"bob"})
+
+    def test_replace_messages(self):
+        session = self.manager.get("alice")
+        session.append(self._message(0))
+        session.replace_messages([self._message(i) for i in range(5, 7)])
+        self.assertEqual(session.all_messages(), [self._message(5), self._message(6)])
+        self.assertEqual(self.manager.memory_report()["alice"], session.memory_bytes)
+
+    def test_expired_logs_are_deleted(self):
+        self.manager.get("alice").append(self._message(0))
+        self.manager.get("bob").append(self._message(1))
+        self.clock.now = 80
+        self.manager.get("bob")
+        alice_log = self.manager._log_path("alice")
+        # Alice is evicted but within retention, so her log is kept for her return
+        self.assertTrue(os.path.exists(alice_log))
+        old = time.time() - self.manager.log_retention - 1
+        os.utime(alice_log, (old, old))
+        os.utime(self.manager._log_path("bob"), (old, old))
+        self.clock.now = 100
+        self.manager.get("bob")
+        self.assertFalse(os.path.exists(alice_log))
+        # Live sessions keep their logs regardless of age
+        self.assertTrue(os.path.exists(self.manager._log_path("bob")))
+        self.assertEqual(self.manager.get("alice").all_messages(), [])
+
+    def test_soak_memory_and_disk_plateau(self):
+        # Thousands of sessions arrive in waves and each goes idle once its wave ends.
+        # With the cap, eviction and log expiry in place, neither traced allocations,
+        # peak process RSS nor the session logs on disk should keep growing.
+        message = {'role': 'user', 'content': 'x' * 1000}
+        manager = SessionManager(
+            os.path.join(self.tmpdir.name, 'soak'), max_session_bytes=40 * message_bytes(message),
+            idle_timeout=60, eviction_interval=10, log_retention=0, clock=self.clock
+        )
+        tracemalloc.start()
+        try:
+            traced, rss = [], []
+            for wave in range(5):
+                for n in range(500):
+                    session = manager.get(f"wave{wave}-session{n}")
+                    for i in range(48):
+                        session.append({'role': 'user', 'content': f"{n:04d}{i:04d}" + 'x' * 992})
+                self.clock.now += 120
+                manager.get("heartbeat")
+                gc.collect()
+                traced.append(tracemalloc.get_traced_memory()[0])
+                rss.append(resident_memory())
+                self.assertEqual(os.listdir(manager.storage_dir), [])
+        finally:
+            tracemalloc.stop()
+        self.assertLessEqual(len(manager), 1)
+        self.assertLess(traced[-1], traced[0] * 1.25)
+        # Each wave holds about 25 MB at its peak; later waves must reuse that memory
+        self.assertLess(rss[-1] - rss[0], 10 * 1024 * 1024)
+
+if __name__ == '__main__':
+    unittest.main()
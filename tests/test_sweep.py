@@ -0,0 +1,87 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+from datawizzy.sweep import (
+    CassetteBackend, MockBackend, ProcessorBackend, SweepConfig, SweepGeneration, build_grid, check_quality,
+    format_report, pareto_front, run_sweep
+)
+
+
+class TestSweep(unittest.TestCase):
+    def test_check_quality(self):
+        good = "Use `dropna`:\n```python\ndf = df.dropna()\n```"
+        self.assertEqual(check_quality(good, ["dropna", "isna"]),
+                         {'parses': 1.0, 'safe': 1.0, 'api_recall': 0.5, 'score': 2.5 / 3})
+        bad = "```python\nimport os\ndf.(\n```"
+        quality = check_quality(bad, [])
+        self.assertEqual((quality['parses'], quality['safe'], quality['api_recall']), (0.0, 0.0, 1.0))
+
+    def test_check_quality_without_code(self):
+        quality = check_quality("Call `dropna` on the DataFrame.", ["dropna"])
+        self.assertEqual(quality['parses'], 0.0)
+        self.assertEqual(quality['score'], 2 / 3)
+
+    def test_api_recall_matches_whole_words(self):
+        text = "The meaning of each heading:\n```python\ndf.plot()\nplt.show()\n```"
+        self.assertEqual(check_quality(text, ["mean", "head"])['api_recall'], 0.0)
+        self.assertEqual(check_quality(text, ["plt.show", "plot"])['api_recall'], 1.0)
+
+    def test_check_quality_ignores_prose(self):
+        text = "Tip: set axis=1 to drop columns.\n```python\ndf = df.drop(columns=['a'])\n```"
+        self.assertEqual(check_quality(text, ["drop"])['parses'], 1.0)
+
+    @patch('datawizzy.nlp_processor.NLPProcessor')
+    def test_processor_backend_builds_one_processor_per_model(self, mock_processor):
+        backend = ProcessorBackend(config_path='config.json', provider='local')
+        for model in ["model-a", "model-b", "model-a"]:
+            backend.generate("How do I remove duplicate rows?", SweepConfig(model, 300, 0.2, 0.0))
+        self.assertEqual(
+            [call.kwargs['model'] for call in mock_processor.call_args_list], ["model-a", "model-b"]
+        )
+
+    def test_processor_backend_rejects_ignored_parameters(self):
+        backend = ProcessorBackend(provider='local')
+        backend.check_grid(build_grid(["m"], [300], [0.2, 0.5], [0.0]))
+        with self.assertRaises(ValueError):
+            backend.check_grid(build_grid(["m"], [300], [0.2], [0.0, 0.6]))
+
+    def test_mock_backend_is_deterministic(self):
+        backend = MockBackend()
+        config = SweepConfig("gpt-4o-mini", 300, 0.5, 0.6)
+        query = "How do I merge two DataFrames on a shared key?"
+        self.assertEqual(backend.generate(query, config), backend.generate(query, config))
+
+    def test_run_sweep_and_report(self):
+        grid = build_grid(["gpt-4o-mini", "llama2"], [300, 600], [0.2], [0.6])
+        self.assertEqual(len(grid), 4)
+        results = run_sweep(MockBackend(), grid)
+        self.assertEqual(len(results), 4)
+        self.assertTrue(all(result['runs'] == 10 for result in results))
+        report = format_report(results)
+        self.assertEqual(len(report.splitlines()), 6)
+        self.assertIn("| * |", report)
+
+    def test_pareto_front(self):
+        results = [
+            {'name': 'fast', 'latency': 1.0, 'tokens': 100, 'score': 0.5},
+            {'name': 'good', 'latency': 3.0, 'tokens': 300, 'score': 0.9},
+            {'name': 'dominated', 'latency': 3.5, 'tokens': 300, 'score': 0.8},
+        ]
+        self.assertEqual([r['name'] for r in pareto_front(results)], ['fast', 'good'])
+
+    def test_cassette_records_and_replays(self):
+        config = SweepConfig("gpt-4o-mini", 300, 0.2, 0.0)
+        query = "How do I remove duplicate rows from a DataFrame?"
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "cassette.json")
+            recorded = CassetteBackend(path, record_from=MockBackend()).generate(query, config)
+            replayed = CassetteBackend(path).generate(query, config)
+            self.assertEqual(recorded, replayed)
+            self.assertIsInstance(replayed, SweepGeneration)
+            with self.assertRaises(KeyError):
+                CassetteBackend(path).generate("Another query", config)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,107 @@
+import os
+import sys
+import tempfile
+import time
+import unittest
+from datawizzy.verifier import SnippetVerifier
+
+
+class TestSnippetVerifier(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.verifier = SnippetVerifier(num_workers=2, timeout=2.0, cpu_seconds=1, preload=('json',))
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.verifier.close()
+
+    def test_successful_snippet(self):
+        result = self.verifier.verify("x = 2 + 2\nprint(x)")
+        self.assertTrue(result.ok)
+        self.assertEqual(result.stdout, "4\n")
+        self.assertFalse(result.cached)
+
+    def test_failing_snippet(self):
+        result = self.verifier.verify("undefined_name + 1")
+        self.assertFalse(result.ok)
+        self.assertIn("NameError", result.error)
+
+    def test_syntax_error(self):
+        result = self.verifier.verify("def broken(:")
+        self.assertFalse(result.ok)
+        self.assertIn("SyntaxError", result.error)
+
+    def test_results_are_cached(self):
+        self.verifier.verify("y = 1")
+        self.assertTrue(self.verifier.verify("y = 1").cached)
+
+    def test_wall_clock_timeout(self):
+        result = self.verifier.verify("import time\ntime.sleep(10)")
+        self.assertFalse(result.ok)
+        self.assertIn("Timed out", result.error)
+
+    def test_cpu_limit(self):
+        result = self.verifier.verify("while True:\n    pass")
+        self.assertFalse(result.ok)
+
+    def test_unsafe_snippet_is_not_run(self):
+        result = self.verifier.verify("import os\nos.remove('x')")
+        self.assertFalse(result.ok)
+        self.assertEqual(result.error, "Rejected by safety check")
+
+    def test_verify_instructions_runs_blocks_together(self):
+        text = "First:\n```python\nvalues = [1, 2, 3]\n```\nThen:\n```python\nprint(sum(values))\n```"
+        result = self.verifier.verify_instructions(text)
+        self.assertTrue(result.ok)
+        self.assertEqual(result.stdout, "6\n")
+        self.assertIsNone(self.verifier.verify_instructions("No code here."))
+
+    def test_verify_instructions_ignores_prose(self):
+        text = "1. Drop the rows:\n```python\nvalues = [1, None]\n```\n2. Pass inplace=True to modify the frame in place."
+        self.assertTrue(self.verifier.verify_instructions(text).ok)
+
+    def test_error_message_stays_in_sandbox(self):
+        result = self.verifier.verify("from pathlib import Path\nraise ValueError(Path('/etc/passwd').read_text())")
+        self.assertFalse(result.ok)
+        self.assertEqual(result.error, "ValueError")
+
+    def test_no_network(self):
+        result = self.verifier.verify("import socket\nsocket.socket().connect(('1.1.1.1', 53))")
+        self.assertFalse(result.ok)
+        self.assertEqual(result.error, "OSError")
+
+    @unittest.skipUnless(hasattr(os, 'geteuid') and os.geteuid() == 0, "only meaningful when started as root")
+    def test_runs_unprivileged(self):
+        self.assertTrue(self.verifier.verify("from os import geteuid\nassert geteuid() != 0").ok)
+
+
+class TestSnippetVerifierWorkers(unittest.TestCase):
+    def test_dead_worker_fails_its_task_and_is_replaced(self):
+        verifier = SnippetVerifier(num_workers=1, timeout=5.0, preload=())
+        try:
+            future = verifier.submit("import time\ntime.sleep(3)")
+            time.sleep(0.5)
+            verifier._workers[0].kill()
+            result = future.result(timeout=10)
+            self.assertFalse(result.ok)
+            self.assertEqual(result.error, "Sandbox worker died")
+            self.assertTrue(verifier.verify("print('back')").ok)
+        finally:
+            verifier.close()
+
+    def test_broken_preload_does_not_block_start_up(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            with open(os.path.join(tmpdir, 'datawizzy_broken_module.py'), 'w') as f:
+                f.write("raise RuntimeError('broken on import')\n")
+            sys.path.insert(0, tmpdir)
+            try:
+                started = time.monotonic()
+                verifier = SnippetVerifier(num_workers=1, preload=('datawizzy_broken_module',))
+                self.assertLess(time.monotonic() - started, 30)
+                verifier.close()
+            finally:
+                sys.path.remove(tmpdir)
+
+
+if __name__ == '__main__':
+    unittest.main()